@@ -1,13 +1,66 @@
-from django.contrib import admin
-from .models import Question, Answer, Test, UserTestResult, ErrorLog, Profile
+import io
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .models import Question, Answer, Test, UserTestResult, ErrorLog, ErrorGroup, Profile, NotificationOutbox, ProfileStats
+from . import questionbank
+from . import resultexport
+from . import errorlog
+from .paginator import CappedCountPaginator, EstimatedCountPaginator
 
 
 
+class AutocompleteFilter(admin.FieldListFilter):
+    # A foreign key filter that searches the related admin instead of listing every choice.
+    template = 'admin/main/autocomplete_filter.html'
 
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        super().__init__(field, request, params, model, model_admin, field_path)
 
-class ProfileAdmin(admin.ModelAdmin):
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        selected = None
+        if self.lookup_val:
+            selected = self.field.remote_field.model._default_manager.filter(
+                **{self.field.target_field.name: self.lookup_val}).first()
+        yield {
+            'value': self.lookup_val if selected is not None else '',
+            'label': str(selected) if selected is not None else '',
+            'clear_url': changelist.get_query_string(remove=[self.lookup_kwarg]),
+        }
+
+class ScalableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_filter_fields = ()
+
+    @property
+    def media(self):
+        media = super().media
+        for field_name in self.autocomplete_filter_fields:
+            media += AutocompleteSelect(self.model._meta.get_field(field_name), self.admin_site).media
+        if self.autocomplete_filter_fields:
+            media += forms.Media(js=['main/admin/autocomplete_filter.js'])
+        return media
+
+class ProfileAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('name', 'phone_number', 'created_at', 'user_link')
+    list_select_related = ('user',)
     list_filter = ('created_at',)
+    ordering = ('-id',)
     search_fields = ('name', 'phone_number', 'user__username')
     readonly_fields = ('created_at',)
     fieldsets = (
@@ -26,28 +79,140 @@ class AnswerInline(admin.TabularInline):
     model = Answer
     extra = 3
 
+def export_response(queryset, fmt, filename):
+    response = StreamingHttpResponse(questionbank.export_questions(queryset, fmt),
+                                     content_type='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+class QuestionImportForm(forms.Form):
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=[(fmt, fmt.upper()) for fmt in questionbank.FORMATS])
+    tests = forms.ModelMultipleChoiceField(Test.objects.all(), required=False,
+                                           help_text='Add the imported questions to these tests.')
+
 class QuestionAdmin(admin.ModelAdmin):
     inlines = [AnswerInline]
+    change_list_template = 'admin/main/question/change_list.html'
+    actions = ['export_jsonl', 'export_csv']
+
+    @admin.action(description='Export selected questions as JSONL')
+    def export_jsonl(self, request, queryset):
+        return export_response(queryset, 'jsonl', 'questions')
+
+    @admin.action(description='Export selected questions as CSV')
+    def export_csv(self, request, queryset):
+        return export_response(queryset, 'csv', 'questions')
+
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_view), name='main_question_import'),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:main_question_changelist')
+        form = QuestionImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8', newline='')
+            try:
+                questions, answers = questionbank.import_questions(
+                    questionbank.parse(stream, form.cleaned_data['format']),
+                    [test.id for test in form.cleaned_data['tests']])
+            except (questionbank.QuestionBankError, UnicodeDecodeError) as e:
+                self.message_user(request, f'Import stopped: {e}', messages.ERROR)
+            else:
+                self.message_user(request, f'Imported {questions} questions and {answers} answers.')
+            return redirect('admin:main_question_changelist')
+        return TemplateResponse(request, 'admin/main/question/import.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': 'Import questions',
+        })
 
 class TestAdmin(admin.ModelAdmin):
+    list_display = ('title', 'question_count', 'sample_size')
+    readonly_fields = ('question_count',)
     filter_horizontal = ('questions',)
+    actions = ['export_jsonl', 'export_csv']
 
-class UserTestResultAdmin(admin.ModelAdmin):
+    @admin.action(description='Export questions of selected tests as JSONL')
+    def export_jsonl(self, request, queryset):
+        return export_response(Question.objects.filter(test__in=queryset).distinct(), 'jsonl', 'questions')
+
+    @admin.action(description='Export questions of selected tests as CSV')
+    def export_csv(self, request, queryset):
+        return export_response(Question.objects.filter(test__in=queryset).distinct(), 'csv', 'questions')
+
+class UserTestResultAdmin(ScalableAdminMixin, admin.ModelAdmin):
     list_display = ('user', 'test', 'score', 'date_taken')
-    list_filter = ('user', 'test', 'date_taken')
-    search_fields = ('user__username', 'test__title')
-    date_hierarchy = 'date_taken'
+    list_select_related = ('user', 'test')
+    list_filter = (('user', AutocompleteFilter), 'test', 'date_taken')
+    autocomplete_filter_fields = ('user',)
+    autocomplete_fields = ('user',)
+    search_fields = ('user__name', 'user__phone_number')
+    ordering = ('-id',)
+    actions = ['export_csv', 'export_jsonl']
+
+    @admin.action(description='Export selected results as CSV')
+    def export_csv(self, request, queryset):
+        return resultexport.response(queryset, 'csv')
 
+    @admin.action(description='Export selected results as JSONL')
+    def export_jsonl(self, request, queryset):
+        return resultexport.response(queryset, 'jsonl')
 
-class ErrorLogAdmin(admin.ModelAdmin):
-    list_display = ['error_number', 'error_message', 'user_agent', 'ip_address','created_at']
+
+class ErrorLogAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ['error_number', 'fingerprint', 'error_message', 'user_agent', 'ip_address','created_at']
     list_filter = [ 'created_at']
-    search_fields = ['error_message', 'user_agent', 'ip_address', 'error_number']
-    readonly_fields = ['error_number', 'error_message', 'user_agent', 'ip_address', 'created_at']
-    ordering = ['-created_at']
+    search_fields = ['error_message', 'user_agent', 'ip_address', 'error_number', '=fingerprint']
+    search_help_text = 'Words in the message, user agent or IP, an error ID or a fingerprint.'
+    readonly_fields = ['error_number', 'fingerprint', 'error_message', 'user_agent', 'ip_address', 'created_at']
+    ordering = ['-id']
+    # Pruning keeps a few samples per group, so ANALYZE statistics go stale quickly.
+    paginator = CappedCountPaginator
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        results = errorlog.search(queryset, search_term)
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        return results, False
+
+
+class ErrorGroupAdmin(admin.ModelAdmin):
+    list_display = ['fingerprint', 'exception_type', 'view', 'message', 'count', 'first_seen', 'last_seen']
+    list_filter = ['exception_type', 'view']
+    search_fields = ['^fingerprint', 'exception_type', 'view']
+    readonly_fields = ['fingerprint', 'exception_type', 'view', 'message', 'count', 'first_seen', 'last_seen']
+    ordering = ['-last_seen']
+
+    def get_search_results(self, request, queryset, search_term):
+        group = ErrorGroup.resolve(search_term.strip()) if '-' in search_term else None
+        if group is not None:
+            return queryset.filter(pk=group.pk), False
+        return super().get_search_results(request, queryset, search_term)
+
+class ProfileStatsAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'tests_taken', 'total_score', 'updated_at')
+    list_select_related = ('profile',)
+    readonly_fields = ('profile', 'tests_taken', 'total_score', 'updated_at')
+
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'attempt', 'status', 'tries', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('profile',)
+    raw_id_fields = ('profile', 'result')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
 
 admin.site.register(ErrorLog, ErrorLogAdmin)
+admin.site.register(ErrorGroup, ErrorGroupAdmin)
+admin.site.register(NotificationOutbox, NotificationOutboxAdmin)
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Test, TestAdmin)
 admin.site.register(UserTestResult, UserTestResultAdmin)
 admin.site.register(Profile, ProfileAdmin)
+admin.site.register(ProfileStats, ProfileStatsAdmin)
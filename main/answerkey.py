@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from array import array
+from asgiref.sync import sync_to_async
+from bisect import bisect_left
+from django.conf import settings
+from . import models as main_models
+from . import cache as main_cache
+from . import metrics as main_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerKey:
+    __slots__ = ('test_id', 'version', 'loaded_at', 'answer_ids', 'question_ids', 'correct')
+
+    def __init__(self, test_id, version, rows):
+        self.test_id = test_id
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.answer_ids = array('q')
+        self.question_ids = array('q')
+        self.correct = bytearray()
+        for answer_id, question_id, is_correct in rows:
+            self.answer_ids.append(answer_id)
+            self.question_ids.append(question_id)
+            self.correct.append(1 if is_correct else 0)
+
+    def __len__(self):
+        return len(self.answer_ids)
+
+    def lookup(self, answer_id):
+        index = bisect_left(self.answer_ids, answer_id)
+        if index == len(self.answer_ids) or self.answer_ids[index] != answer_id:
+            return None
+        return self.question_ids[index], bool(self.correct[index])
+
+    @property
+    def nbytes(self):
+        return (self.answer_ids.itemsize * len(self.answer_ids)
+                + self.question_ids.itemsize * len(self.question_ids)
+                + len(self.correct))
+
+
+_keys = {}
+_lock = threading.Lock()
+
+
+def get_ttl():
+    return getattr(settings, 'ANSWER_KEY_TTL', 300)
+
+
+def is_current(key, version):
+    # The version only moves in the process that saw the change unless the cache is shared,
+    # so keys are also reloaded once they are older than ANSWER_KEY_TTL.
+    return key is not None and key.version == version and time.monotonic() - key.loaded_at < get_ttl()
+
+
+def load(test_id, version):
+    rows = (main_models.Answer.objects.filter(question__test=test_id).order_by('id')
+            .values_list('id', 'question_id', 'is_correct').iterator(chunk_size=10000))
+    key = AnswerKey(test_id, version, rows)
+    logger.info('Loaded answer key for test %s: %d answers, %d bytes', test_id, len(key), key.nbytes)
+    main_metrics.set_gauge('answer_key_bytes', (('test', test_id),), key.nbytes)
+    main_metrics.set_gauge('answer_key_entries', (('test', test_id),), len(key))
+    return key
+
+
+def get_key(test_id, version=None):
+    if version is None:
+        version = main_cache.get_version()
+    key = _keys.get(test_id)
+    if is_current(key, version):
+        return key
+    with _lock:
+        key = _keys.get(test_id)
+        if not is_current(key, version):
+            key = _keys[test_id] = load(test_id, version)
+        return key
+
+
+async def aget_key(test_id, version=None):
+    # Keys are in memory between reloads; only a reload needs a thread for the ORM.
+    if version is None:
+        version = await main_cache.aget_version()
+    key = _keys.get(test_id)
+    if is_current(key, version):
+        return key
+    return await sync_to_async(get_key)(test_id, version)
+
+
+def lookup_answer(test_id, answer_id):
+    try:
+        answer_id = int(answer_id)
+    except (TypeError, ValueError):
+        return None
+    return get_key(test_id).lookup(answer_id)
+
+
+async def alookup_answer(test_id, answer_id):
+    try:
+        answer_id = int(answer_id)
+    except (TypeError, ValueError):
+        return None
+    return (await aget_key(test_id)).lookup(answer_id)
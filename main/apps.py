@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import database
+        from . import signals
+        connection_created.connect(database.configure_connection, dispatch_uid='main.database.configure_connection')
+        from . import retention
+        retention.register_archives()
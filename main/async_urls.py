@@ -0,0 +1,19 @@
+from django.urls import path
+from . import async_views as main_async_views
+from . import views as main_views
+
+urlpatterns = [
+    path('register/', main_async_views.AsyncRegisterAPIView.as_view(), name="register"),
+    path('questions/', main_async_views.AsyncQuestionAPIView.as_view(), name="question"),
+    path('answer/', main_async_views.AsyncAnswerAPIView.as_view(), name="answer"),
+    path('answers/', main_async_views.AsyncBulkAnswerAPIView.as_view(), name="answers"),
+    path('result/', main_async_views.AsyncResultAPIView.as_view(), name="result"),
+    path('leaderboard/', main_async_views.AsyncLeaderboardAPIView.as_view(), name="leaderboard"),
+    path('results/export/', main_views.results_export_view, name="results-export"),
+    path('tests/', main_async_views.AsyncTestListAPIView.as_view(), name="tests"),
+    path('tests/<int:test_id>/questions/', main_async_views.AsyncQuestionAPIView.as_view(), name="test-question"),
+    path('tests/<int:test_id>/answer/', main_async_views.AsyncAnswerAPIView.as_view(), name="test-answer"),
+    path('tests/<int:test_id>/answers/', main_async_views.AsyncBulkAnswerAPIView.as_view(), name="test-answers"),
+    path('tests/<int:test_id>/result/', main_async_views.AsyncResultAPIView.as_view(), name="test-result"),
+    path('tests/<int:test_id>/leaderboard/', main_async_views.AsyncLeaderboardAPIView.as_view(), name="test-leaderboard"),
+]
@@ -0,0 +1,218 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from . import models as main_models
+from . import authentication as main_authentication
+from . import cache as main_cache
+from . import compression as main_compression
+from . import scoring as main_scoring
+from . import notifications as main_notifications
+from . import errorlog as main_errorlog
+from . import grading as main_grading
+from . import leaderboard as main_leaderboard
+from . import registration as main_registration
+from . import database as main_database
+
+
+async def authenticate(request):
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) != 2 or auth[0].lower() != 'token':
+        return None
+    entry = await main_authentication.aresolve(auth[1])
+    if entry is None or not entry[1].is_active:
+        return None
+    token, user, request.profile = entry
+    await main_database.aidentify(token.key)
+    return user
+
+
+def get_data(request):
+    if not request.body:
+        return {}
+    data = json.loads(request.body)
+    return data if isinstance(data, dict) else {}
+
+
+class AsyncAPIView(View):
+    http_method_names = ['get', 'post', 'options']
+    authentication_required = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        handler = getattr(self, request.method.lower(), None)
+        if request.method.lower() not in self.http_method_names or handler is None:
+            return await self.http_method_not_allowed(request, *args, **kwargs)
+        if request.method == 'OPTIONS':
+            return await handler(request, *args, **kwargs)
+        if self.authentication_required:
+            request.user = await authenticate(request)
+            if request.user is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        try:
+            request.data = get_data(request)
+        except ValueError as e:
+            # json.JSONDecodeError and UnicodeDecodeError are both ValueErrors.
+            return JsonResponse({'detail': 'JSON parse error - {}'.format(e)}, status=400)
+        return await handler(request, *args, **kwargs)
+
+
+class AsyncRegisterAPIView(AsyncAPIView):
+    authentication_required = False
+
+    async def post(self, request):
+        try:
+            data = request.data
+            name = data.get('name')
+            phone_number = data.get('phone_number')
+
+            if name is None or phone_number is None:
+                error_code = main_errorlog.log_error(request, 'Username or password is missing.')
+                return JsonResponse({'error': 'Username or password is missing. Error ID: {}'.format(error_code)},
+                                    status=400)
+
+            try:
+                # register and set_score run in a transaction, which the async ORM does not support.
+                token_key, created = await sync_to_async(main_registration.register)(name, phone_number)
+            except main_registration.RegistrationError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
+            if not created:
+                return JsonResponse({'success': 'User with this username already exists.',
+                                     'user_token': token_key}, status=200)
+            return JsonResponse({'success': 'User created successfully.', 'user_token': token_key}, status=201)
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
+
+
+async def load_questions(auth_user_id, test_id=None):
+    version = await main_cache.aget_version()
+    test = await main_cache.aresolve_test(test_id, version)
+    if test is None:
+        return None
+    if test['sample_size']:
+        seed = await main_models.UserTestResult.aget_attempt_seed(auth_user_id, test['id'])
+        return await main_cache.aget_sampled_questions(test['id'], test['sample_size'], seed, version)
+    return await main_cache.aget_shuffled_question_set(test['id'], version)
+
+
+class AsyncTestListAPIView(AsyncAPIView):
+    async def get(self, request):
+        try:
+            catalog = await main_cache.aget_catalog()
+            return main_compression.mark_shared(JsonResponse(list(catalog['tests'].values()), safe=False))
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
+
+
+class AsyncQuestionAPIView(AsyncAPIView):
+    async def get(self, request, test_id=None):
+        try:
+            questions = await load_questions(request.user.id, test_id)
+            if questions is None:
+                return JsonResponse({'error': 'Test not found'}, status=404)
+            if not questions:
+                return JsonResponse({'error': 'No questions available for this test'}, status=404)
+            return JsonResponse(questions, safe=False)
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
+
+
+class AsyncAnswerAPIView(AsyncAPIView):
+    async def post(self, request, test_id=None):
+        try:
+            user = request.profile
+            answer_id = request.data.get('answer_id')
+
+            if user is None or answer_id is None:
+                return JsonResponse({'error': 'User or answer ID is missing'}, status=400)
+
+            test = await main_cache.aresolve_test(test_id)
+            if test is None:
+                return JsonResponse({'error': 'Test not found'}, status=404)
+
+            answer = await main_grading.alookup_answer(test, request.user.id, answer_id)
+            if answer is None or not answer[1]:
+                return JsonResponse({'error': 'Invalid answer'}, status=400)
+
+            await main_scoring.aincrement(user.id, test['id'])
+            return JsonResponse({'success': 'Score updated successfully'}, status=200)
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
+
+
+class AsyncBulkAnswerAPIView(AsyncAPIView):
+    async def post(self, request, test_id=None):
+        try:
+            user = request.profile
+            test = await main_cache.aresolve_test(test_id)
+            if test is None:
+                return JsonResponse({'error': 'Test not found'}, status=404)
+
+            try:
+                score = await main_grading.agrade(test, request.user.id, request.data.get('answer_ids'))
+            except main_grading.GradingError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+
+            await sync_to_async(main_scoring.set_score)(user.id, test['id'], score)
+            return JsonResponse({'success': 'Answers graded successfully', 'score': score}, status=200)
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
+
+
+class AsyncResultAPIView(AsyncAPIView):
+    async def get(self, request, test_id=None):
+        try:
+            profile = request.profile
+            if profile is None:
+                raise main_models.Profile.DoesNotExist('Profile not found')
+            queryset = main_models.UserTestResult.objects.filter(user=profile).select_related('test')
+            if test_id is not None:
+                queryset = queryset.filter(test_id=test_id)
+            test_results = [result async for result in queryset]
+
+            data = []
+            for result in test_results:
+                result.score += main_scoring.buffered(profile.id, result.test_id)
+                data.append({
+                    'test_id': result.test_id,
+                    'test_title': result.test.title,
+                    'score': result.score,
+                    'date_taken': result.date_taken,
+                    "question_count": result.test.served_question_count,
+                    **await main_leaderboard.adescribe(result.test_id, result.score),
+                })
+
+            await main_notifications.aenqueue_results(profile, test_results)
+
+            return JsonResponse(data, status=200, safe=False)
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'Profile not found. Error ID: {}'.format(error_code)}, status=404)
+
+
+class AsyncLeaderboardAPIView(AsyncAPIView):
+    async def get(self, request, test_id=None):
+        try:
+            test = await main_cache.aresolve_test(test_id)
+            if test is None:
+                return JsonResponse({'error': 'Test not found'}, status=404)
+            try:
+                limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+            except ValueError:
+                return JsonResponse({'error': 'Invalid limit'}, status=400)
+            profile = request.profile
+            return JsonResponse(await main_leaderboard.abuild(test, profile.id, limit))
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return JsonResponse({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=500)
@@ -0,0 +1,172 @@
+import threading
+import time
+from asgiref.sync import sync_to_async
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from . import models as main_models
+from . import metrics as main_metrics
+from . import database as main_database
+
+
+class LocalTokenCache:
+    def __init__(self, ttl=60, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class MemcacheTokenCache:
+    prefix = 'auth:token:'
+
+    def __init__(self, client, ttl=60):
+        self.client = client
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value):
+        self.client.set(self.prefix + key, value, expire=self.ttl, noreply=True)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key, noreply=False)
+
+
+def get_config():
+    config = {
+        'ttl': 60,
+        'max_entries': 10000,
+        'store': 'local',
+    }
+    config.update(getattr(settings, 'TOKEN_AUTH_CACHE', {}))
+    return config
+
+
+def build_cache(config):
+    if config['store'] == 'memcache':
+        from pymemcache import serde
+        from pymemcache.client.base import PooledClient
+        return MemcacheTokenCache(PooledClient(config.get('location', '127.0.0.1:11211'), serde=serde.pickle_serde,
+                                               timeout=0.2, connect_timeout=0.2), config['ttl'])
+    return LocalTokenCache(config['ttl'], config['max_entries'])
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = build_cache(get_config())
+    return _cache
+
+
+def load(key):
+    return unpack(Token.objects.select_related('user__profile').filter(key=key).first())
+
+
+async def aload(key):
+    return unpack(await Token.objects.select_related('user__profile').filter(key=key).afirst())
+
+
+def unpack(token):
+    if token is None:
+        return None
+    try:
+        profile = token.user.profile
+    except main_models.Profile.DoesNotExist:
+        profile = None
+    return token, token.user, profile
+
+
+def resolve(key):
+    cache = get_cache()
+    entry = cache.get(key)
+    if entry is None:
+        main_metrics.inc('token_auth_cache_total', (('result', 'miss'),))
+        entry = load(key)
+        if entry is None:
+            return None
+        cache.set(key, entry)
+    else:
+        main_metrics.inc('token_auth_cache_total', (('result', 'hit'),))
+    return entry
+
+
+async def aresolve(key):
+    cache = get_cache()
+    if isinstance(cache, MemcacheTokenCache):
+        # A memcache round trip blocks; only the in-process cache is read on the event loop.
+        return await sync_to_async(resolve)(key)
+    entry = cache.get(key)
+    if entry is None:
+        main_metrics.inc('token_auth_cache_total', (('result', 'miss'),))
+        entry = await aload(key)
+        if entry is None:
+            return None
+        cache.set(key, entry)
+    else:
+        main_metrics.inc('token_auth_cache_total', (('result', 'hit'),))
+    return entry
+
+
+def invalidate(*keys):
+    cache = get_cache()
+    for key in keys:
+        cache.delete(key)
+
+
+def invalidate_user(user_id):
+    invalidate(*Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Same contract as TokenAuthentication, but token -> (user, profile) comes from the token
+    # cache and the profile is attached as request.profile.
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None:
+            request.profile = self.profile
+        return result
+
+    def authenticate_credentials(self, key):
+        entry = resolve(key)
+        if entry is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        token, user, self.profile = entry
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        main_database.identify(token.key)
+        return user, token
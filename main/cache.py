@@ -0,0 +1,237 @@
+import random
+import threading
+import time
+from array import array
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from . import models as main_models
+from . import serializers as main_serializers
+
+
+VERSION_KEY = 'main:questions:version'
+CATALOG_KEY = 'main:questions:catalog:v{version}'
+QUESTION_SET_KEY = 'main:questions:set:{test_id}:v{version}'
+QUESTION_KEY = 'main:questions:item:{question_id}:v{version}'
+
+# test id -> (version, loaded_at, question ids). Kept in the process rather than in the cache
+# backend, which would copy the whole list on every draw.
+_question_ids = {}
+_question_ids_lock = threading.Lock()
+
+
+def get_timeout():
+    return getattr(settings, 'QUESTION_CACHE_TIMEOUT', 300)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(VERSION_KEY, version, None)
+    return version
+
+
+async def aget_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        version = 1
+        await cache.aadd(VERSION_KEY, version, None)
+    return version
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
+
+
+def get_catalog(version=None):
+    if version is None:
+        version = get_version()
+    key = CATALOG_KEY.format(version=version)
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_catalog(list(catalog_queryset()))
+        cache.set(key, catalog, get_timeout())
+    return catalog
+
+
+async def aget_catalog(version=None):
+    if version is None:
+        version = await aget_version()
+    key = CATALOG_KEY.format(version=version)
+    catalog = await cache.aget(key)
+    if catalog is None:
+        catalog = build_catalog([test async for test in catalog_queryset()])
+        await cache.aset(key, catalog, get_timeout())
+    return catalog
+
+
+def catalog_queryset():
+    return main_models.Test.objects.order_by('id').values('id', 'title', 'sample_size', 'question_count')
+
+
+def build_catalog(tests):
+    return {
+        'default': tests[0]['id'] if tests else None,
+        'tests': {test['id']: test for test in tests},
+    }
+
+
+def get_default_test_id(version=None):
+    return get_catalog(version)['default']
+
+
+def get_test(test_id, version=None):
+    return get_catalog(version)['tests'].get(test_id)
+
+
+def resolve_test(test_id=None, version=None):
+    catalog = get_catalog(version)
+    if test_id is None:
+        test_id = catalog['default']
+    return catalog['tests'].get(test_id)
+
+
+async def aresolve_test(test_id=None, version=None):
+    catalog = await aget_catalog(version)
+    if test_id is None:
+        test_id = catalog['default']
+    return catalog['tests'].get(test_id)
+
+
+def serialize_questions(queryset):
+    serializer = main_serializers.QuestionSerializer(queryset.prefetch_related('answers'), many=True)
+    return [dict(question, answers=[dict(answer) for answer in question['answers']])
+            for question in serializer.data]
+
+
+def build_question_set(test_id):
+    return serialize_questions(main_models.Question.objects.filter(test=test_id).order_by('id'))
+
+
+def get_question_set(test_id, version=None):
+    if version is None:
+        version = get_version()
+    key = QUESTION_SET_KEY.format(test_id=test_id, version=version)
+    questions = cache.get(key)
+    if questions is None:
+        questions = build_question_set(test_id)
+        cache.set(key, questions, get_timeout())
+    return questions
+
+
+async def aget_question_set(test_id, version=None):
+    if version is None:
+        version = await aget_version()
+    key = QUESTION_SET_KEY.format(test_id=test_id, version=version)
+    questions = await cache.aget(key)
+    if questions is None:
+        # The serializer walks the prefetched answers synchronously; this only runs on a miss.
+        questions = await sync_to_async(build_question_set)(test_id)
+        await cache.aset(key, questions, get_timeout())
+    return questions
+
+
+def get_shuffled_question_set(test_id, version=None):
+    questions = get_question_set(test_id, version)
+    return random.sample(questions, len(questions))
+
+
+async def aget_shuffled_question_set(test_id, version=None):
+    questions = await aget_question_set(test_id, version)
+    return random.sample(questions, len(questions))
+
+
+def current_question_ids(test_id, version):
+    # As with answer keys, the version only moves in the process that saw the change unless the
+    # cache is shared, so the ids are also reloaded after QUESTION_CACHE_TIMEOUT.
+    entry = _question_ids.get(test_id)
+    if entry is not None and entry[0] == version and time.monotonic() - entry[1] < get_timeout():
+        return entry[2]
+    return None
+
+
+def get_question_ids(test_id, version=None):
+    if version is None:
+        version = get_version()
+    question_ids = current_question_ids(test_id, version)
+    if question_ids is None:
+        with _question_ids_lock:
+            question_ids = current_question_ids(test_id, version)
+            if question_ids is None:
+                question_ids = array('q', question_ids_queryset(test_id))
+                _question_ids[test_id] = (version, time.monotonic(), question_ids)
+    return question_ids
+
+
+async def aget_question_ids(test_id, version=None):
+    if version is None:
+        version = await aget_version()
+    question_ids = current_question_ids(test_id, version)
+    if question_ids is None:
+        question_ids = array('q', [question_id async for question_id in question_ids_queryset(test_id)])
+        _question_ids[test_id] = (version, time.monotonic(), question_ids)
+    return question_ids
+
+
+def question_ids_queryset(test_id):
+    return main_models.Question.objects.filter(test=test_id).order_by('id').values_list('id', flat=True)
+
+
+def get_questions(question_ids, version=None):
+    if version is None:
+        version = get_version()
+    keys = {question_id: QUESTION_KEY.format(question_id=question_id, version=version) for question_id in question_ids}
+    found = cache.get_many(keys.values())
+    questions = {question_id: found[key] for question_id, key in keys.items() if key in found}
+    missing = [question_id for question_id in question_ids if question_id not in questions]
+    if missing:
+        loaded = {question['id']: question
+                  for question in serialize_questions(main_models.Question.objects.filter(id__in=missing))}
+        cache.set_many({keys[question_id]: question for question_id, question in loaded.items()}, get_timeout())
+        questions.update(loaded)
+    return [questions[question_id] for question_id in question_ids if question_id in questions]
+
+
+async def aget_questions(question_ids, version=None):
+    if version is None:
+        version = await aget_version()
+    keys = {question_id: QUESTION_KEY.format(question_id=question_id, version=version) for question_id in question_ids}
+    found = await cache.aget_many(keys.values())
+    questions = {question_id: found[key] for question_id, key in keys.items() if key in found}
+    missing = [question_id for question_id in question_ids if question_id not in questions]
+    if missing:
+        loaded = {question['id']: question for question in await sync_to_async(serialize_questions)(
+            main_models.Question.objects.filter(id__in=missing))}
+        await cache.aset_many({keys[question_id]: question for question_id, question in loaded.items()},
+                              get_timeout())
+        questions.update(loaded)
+    return [questions[question_id] for question_id in question_ids if question_id in questions]
+
+
+def sample_question_ids(question_ids, sample_size, seed):
+    rng = random.Random(seed)
+    return rng.sample(question_ids, min(sample_size, len(question_ids)))
+
+
+def get_sampled_question_ids(test_id, sample_size, seed, version=None):
+    return sample_question_ids(get_question_ids(test_id, version), sample_size, seed)
+
+
+async def aget_sampled_question_ids(test_id, sample_size, seed, version=None):
+    return sample_question_ids(await aget_question_ids(test_id, version), sample_size, seed)
+
+
+def get_sampled_questions(test_id, sample_size, seed, version=None):
+    if version is None:
+        version = get_version()
+    return get_questions(get_sampled_question_ids(test_id, sample_size, seed, version), version)
+
+
+async def aget_sampled_questions(test_id, sample_size, seed, version=None):
+    if version is None:
+        version = await aget_version()
+    return await aget_questions(await aget_sampled_question_ids(test_id, sample_size, seed, version), version)
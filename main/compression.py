@@ -0,0 +1,96 @@
+import hashlib
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from django.conf import settings
+
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+class CompressedBodyCache:
+    def __init__(self, max_entries=256, max_body_size=128 * 1024):
+        self.max_entries = max_entries
+        self.max_body_size = max_body_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_body_size:
+            return
+        with self.lock:
+            self.entries[key] = body
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+def get_config():
+    config = {
+        'level': 6,
+        'min_length': 200,
+        'cache_entries': 256,
+        'cache_max_body_size': 128 * 1024,
+    }
+    config.update(getattr(settings, 'GZIP', {}))
+    return config
+
+
+def is_compressible(content_type):
+    content_type = content_type.split(';', 1)[0].strip().lower()
+    return content_type.startswith(COMPRESSIBLE_TYPES) or content_type.endswith('+json')
+
+
+def compress(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def mark_shared(response):
+    # Views set this on bodies that many clients receive byte for byte, e.g. the test catalog.
+    # Anything per user or shuffled per request would only fill the cache with one-off entries.
+    response.gzip_shared = True
+    return response
+
+
+def is_cacheable(response):
+    return getattr(response, 'gzip_shared', False) or response.has_header('ETag')
+
+
+def cache_key(path, content, etag, level):
+    if etag:
+        # ETags are only unique per URL (WhiteNoise derives them from mtime and size).
+        return (path, etag, level)
+    return (hashlib.blake2b(content, digest_size=16).digest(), level)
+
+
+async def acompress_stream(chunks, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,158 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def get_pragmas(settings_dict):
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'cache_size': -20000,
+        'mmap_size': 128 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    # A database can override single pragmas, or pass 'PRAGMAS': None to keep SQLite's defaults.
+    if 'PRAGMAS' in settings_dict:
+        if settings_dict['PRAGMAS'] is None:
+            return {}
+        pragmas.update(settings_dict['PRAGMAS'])
+    return pragmas
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in get_pragmas(connection.settings_dict).items():
+        connection.connection.execute(f'PRAGMA {name} = {value}').fetchall()
+
+
+ERROR_MODELS = ('main.errorlog', 'main.errorgroup')
+PIN_KEY = 'main:db:pinned:{client}'
+
+_request = Local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def get_pin_seconds():
+    return getattr(settings, 'DATABASE_PIN_SECONDS', 2 * getattr(settings, 'DATABASE_REPLICA_REFRESH_INTERVAL', 30))
+
+
+def get_pin_store():
+    # Must be shared by every worker, or a write on one worker would not pin the client on the others.
+    return caches[getattr(settings, 'DATABASE_PIN_CACHE', 'pins')]
+
+
+def client_key(request):
+    # Session clients are known from their cookie up front; API clients are identified by
+    # their token once authentication has run (see identify).
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return f'session:{session}' if session else None
+
+
+def pin_key(credential):
+    return PIN_KEY.format(client=hashlib.sha256(credential.encode()).hexdigest()[:32])
+
+
+def identify(credential):
+    # Ties the current request to a client. Reads go to the primary if that client wrote within
+    # DATABASE_PIN_SECONDS, and a write in this request pins it for the next ones.
+    state = getattr(_request, 'state', None)
+    if state is None or not get_replicas():
+        return
+    state['client'] = pin_key(credential)
+    if not state['pinned'] and get_pin_store().get(state['client']):
+        state['pinned'] = True
+
+
+async def aidentify(credential):
+    state = getattr(_request, 'state', None)
+    if state is None or not get_replicas():
+        return
+    state['client'] = pin_key(credential)
+    if not state['pinned'] and await get_pin_store().aget(state['client']):
+        state['pinned'] = True
+
+
+@contextmanager
+def request_scope(client=None):
+    # Replicas are only read inside a request. The state is a mutable dict so a write made in a
+    # sync_to_async thread pins the request that owns it.
+    state = _request.state = {'pinned': False, 'wrote': False, 'client': None}
+    if client:
+        identify(client)
+    try:
+        yield state
+    finally:
+        del _request.state
+        if state['wrote'] and state['client']:
+            get_pin_store().set(state['client'], True, get_pin_seconds())
+
+
+def pin_primary():
+    state = getattr(_request, 'state', None)
+    if state is not None:
+        state['pinned'] = state['wrote'] = True
+
+
+def use_replica(model):
+    state = getattr(_request, 'state', None)
+    if state is None or state['pinned'] or not get_replicas():
+        return False
+    if model._meta.label_lower not in getattr(settings, 'DATABASE_REPLICA_MODELS', ()):
+        return False
+    # Reads inside a transaction on the primary must see its uncommitted writes.
+    return not connections[DEFAULT_DB_ALIAS].in_atomic_block
+
+
+class PrimaryReplicaRouter:
+    # Error tables live in errors_db. Everything else is written to default; inside a request,
+    # reads of DATABASE_REPLICA_MODELS go to a random replica until the request writes.
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in ERROR_MODELS:
+            return 'errors_db'
+        if use_replica(model):
+            return random.choice(get_replicas())
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in ERROR_MODELS:
+            return 'errors_db'
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        primary = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in primary and obj2._state.db in primary:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            # Replicas are copies of default made by refresh_replicas.
+            return False
+        is_error_model = f'{app_label}.{model_name}' in ERROR_MODELS
+        if db == 'errors_db':
+            return is_error_model
+        if is_error_model:
+            return False
+        return None
+
+
+def refresh_replica(alias, pages=-1):
+    # The backup API copies default into the replica through SQLite's own locking. In WAL mode
+    # neither the primary's writers nor the replica's readers are blocked while it runs.
+    source = connections[DEFAULT_DB_ALIAS]
+    target = connections[alias]
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection, pages=pages)
@@ -0,0 +1,231 @@
+import atexit
+import hashlib
+import logging
+import queue
+import re
+import threading
+import uuid
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+from . import models as main_models
+from . import metrics as main_metrics
+
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'main_errorlog_fts'
+ERROR_CODE_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{6}|[0-9a-f]{32}')
+FINGERPRINT_PATTERN = re.compile(r'[0-9a-f]{16}')
+
+NORMALIZE_PATTERNS = [
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "'?'"),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.I), '<uuid>'),
+    (re.compile(r'\b0x[0-9a-f]+\b|\b[0-9a-f]{16,}\b', re.I), '<hex>'),
+    (re.compile(r'\d+'), '<n>'),
+]
+
+
+class ErrorLogWriter:
+    def __init__(self, max_size=10000, batch_size=500, interval=1.0, policy='drop', sample_rate=10,
+                 samples_per_group=20):
+        self.queue = queue.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.samples_per_group = samples_per_group
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.overflow = 0
+        self.metrics = {'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0}
+
+    def count(self, outcome, value=1):
+        self.metrics[outcome] += value
+        main_metrics.inc('error_log_entries_total', (('outcome', outcome),), value)
+
+    def put(self, entry):
+        self.start()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.handle_overflow(entry)
+        else:
+            self.count('enqueued')
+
+    def handle_overflow(self, entry):
+        with self.lock:
+            self.overflow += 1
+            keep = self.policy == 'sample' and self.overflow % self.sample_rate == 0
+        if keep:
+            # Make room for every Nth overflowing entry by evicting the oldest queued one.
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(entry)
+                self.count('enqueued')
+            except (queue.Empty, queue.Full):
+                pass
+        self.count('dropped')
+
+    def take_batch(self, timeout=None):
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait())
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def upsert_groups(self, connection, batch):
+        groups = {}
+        for entry in batch:
+            group = groups.get(entry['fingerprint'])
+            if group is None:
+                groups[entry['fingerprint']] = group = dict(entry, count=0, first_seen=entry['seen_at'])
+            group['count'] += 1
+            group['last_seen'] = entry['seen_at']
+        table = connection.ops.quote_name(main_models.ErrorGroup._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (fingerprint, exception_type, view, message, count, first_seen, last_seen) '
+                f'VALUES (%s, %s, %s, %s, %s, %s, %s) '
+                f'ON CONFLICT (fingerprint) DO UPDATE SET count = count + excluded.count, last_seen = excluded.last_seen',
+                [
+                    (fingerprint, group['exception_type'][:100], group['view'][:100], group['normalized'],
+                     group['count'], connection.ops.adapt_datetimefield_value(group['first_seen']),
+                     connection.ops.adapt_datetimefield_value(group['last_seen']))
+                    for fingerprint, group in groups.items()
+                ],
+            )
+        return groups
+
+    def store_samples(self, batch, groups):
+        samples = []
+        for fingerprint in groups:
+            entries = [entry for entry in batch if entry['fingerprint'] == fingerprint]
+            samples.extend(entries[-self.samples_per_group:])
+        main_models.ErrorLog.objects.using('errors_db').bulk_create([
+            main_models.ErrorLog(
+                error_number=entry['error_number'],
+                fingerprint=entry['fingerprint'],
+                error_message=entry['message'],
+                user_agent=entry['user_agent'],
+                ip_address=entry['ip_address'],
+            )
+            for entry in samples
+        ], batch_size=self.batch_size)
+        for fingerprint in groups:
+            cutoff = main_models.ErrorLog.objects.filter(fingerprint=fingerprint).order_by('-id').values_list(
+                'id', flat=True)[self.samples_per_group:self.samples_per_group + 1].first()
+            if cutoff is not None:
+                main_models.ErrorLog.objects.filter(fingerprint=fingerprint, id__lte=cutoff).delete()
+
+    def write(self, batch):
+        connection = connections['errors_db']
+        try:
+            with transaction.atomic(using='errors_db'):
+                groups = self.upsert_groups(connection, batch)
+                self.store_samples(batch, groups)
+        except Exception:
+            self.count('failed', len(batch))
+            logger.exception('Could not write %d error log entries', len(batch))
+        else:
+            self.count('written', len(batch))
+
+    def flush(self):
+        written = 0
+        with self.flush_lock:
+            while True:
+                batch = self.take_batch()
+                if not batch:
+                    return written
+                self.write(batch)
+                written += len(batch)
+
+    def run(self):
+        while True:
+            batch = self.take_batch(timeout=self.interval)
+            if batch:
+                with self.flush_lock:
+                    self.write(batch)
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='errorlog-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ErrorLogWriter(**getattr(settings, 'ERROR_LOG_WRITER', {}))
+        return _writer
+
+
+def normalize_message(message):
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message[:500]
+
+
+def fingerprint_for(exception_type, view, normalized):
+    return hashlib.sha1(f'{exception_type}|{view}|{normalized}'.encode()).hexdigest()[:16]
+
+
+def new_error_code(fingerprint):
+    return f'{fingerprint[:8]}-{uuid.uuid4().hex[:6]}'
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is not None:
+        return resolver_match.view_name
+    return request.path
+
+
+def log_error(request, error):
+    message = str(error)
+    exception_type = type(error).__name__ if isinstance(error, BaseException) else 'Error'
+    view = get_view_name(request)
+    normalized = normalize_message(message)
+    fingerprint = fingerprint_for(exception_type, view, normalized)
+    error_code = new_error_code(fingerprint)
+    get_writer().put({
+        'error_number': error_code,
+        'fingerprint': fingerprint,
+        'exception_type': exception_type,
+        'view': view,
+        'message': message,
+        'normalized': normalized,
+        'user_agent': request.META.get('HTTP_USER_AGENT') or '',
+        'ip_address': request.META.get('REMOTE_ADDR') or '',
+        'seen_at': timezone.now(),
+    })
+    return error_code
+
+
+def search(queryset, term):
+    # Error IDs and fingerprints hit their indexes; anything else goes through the FTS5 index
+    # over message, user agent and IP, matching every word as a prefix.
+    term = term.strip()
+    if ERROR_CODE_PATTERN.fullmatch(term):
+        return queryset.filter(error_number=term)
+    if FINGERPRINT_PATTERN.fullmatch(term):
+        return queryset.filter(fingerprint=term)
+    words = re.findall(r'\w+', term)
+    if not words or connections[queryset.db].vendor != 'sqlite':
+        return None
+    query = ' '.join(f'"{word}"*' for word in words)
+    return queryset.filter(pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [query]))
@@ -0,0 +1,88 @@
+from . import models as main_models
+from . import cache as main_cache
+from . import answerkey as main_answerkey
+
+
+class GradingError(Exception):
+    pass
+
+
+def parse_answer_ids(answer_ids):
+    if not isinstance(answer_ids, list) or not answer_ids:
+        raise GradingError('answer_ids must be a non-empty list')
+    try:
+        answer_ids = [int(answer_id) for answer_id in answer_ids]
+    except (TypeError, ValueError):
+        raise GradingError('answer_ids must contain integers')
+    if len(set(answer_ids)) != len(answer_ids):
+        raise GradingError('Duplicate answers submitted')
+    return answer_ids
+
+
+def served_question_ids(test, auth_user_id):
+    # Sampled tests only accept answers to the questions drawn for the current attempt.
+    if not test['sample_size']:
+        return None
+    seed = main_models.UserTestResult.get_attempt_seed(auth_user_id, test['id'])
+    return set(main_cache.get_sampled_question_ids(test['id'], test['sample_size'], seed))
+
+
+async def aserved_question_ids(test, auth_user_id):
+    if not test['sample_size']:
+        return None
+    seed = await main_models.UserTestResult.aget_attempt_seed(auth_user_id, test['id'])
+    return set(await main_cache.aget_sampled_question_ids(test['id'], test['sample_size'], seed))
+
+
+def check_answer(entry, served):
+    if entry is None or (served is not None and entry[0] not in served):
+        return None
+    return entry
+
+
+def lookup_answer(test, auth_user_id, answer_id):
+    return check_answer(main_answerkey.lookup_answer(test['id'], answer_id), served_question_ids(test, auth_user_id))
+
+
+async def alookup_answer(test, auth_user_id, answer_id):
+    entry = await main_answerkey.alookup_answer(test['id'], answer_id)
+    return check_answer(entry, await aserved_question_ids(test, auth_user_id))
+
+
+def grade_rows(answer_ids, rows):
+    if len(rows) != len(answer_ids):
+        found = {answer_id for answer_id, _, _ in rows}
+        missing = [answer_id for answer_id in answer_ids if answer_id not in found]
+        raise GradingError('Answers do not belong to this test: {}'.format(missing))
+    answered = set()
+    score = 0
+    for answer_id, question_id, is_correct in rows:
+        if question_id in answered:
+            raise GradingError('More than one answer submitted for question {}'.format(question_id))
+        answered.add(question_id)
+        score += bool(is_correct)
+    return score
+
+
+def grade_key(key, answer_ids, served=None):
+    rows = []
+    for answer_id in answer_ids:
+        entry = key.lookup(answer_id)
+        if entry is not None:
+            rows.append((answer_id,) + entry)
+    if served is not None:
+        unserved = [answer_id for answer_id, question_id, _ in rows if question_id not in served]
+        if unserved:
+            raise GradingError('Answers are not for questions served in this attempt: {}'.format(unserved))
+    return grade_rows(answer_ids, rows)
+
+
+def grade(test, auth_user_id, answer_ids):
+    answer_ids = parse_answer_ids(answer_ids)
+    return grade_key(main_answerkey.get_key(test['id']), answer_ids, served_question_ids(test, auth_user_id))
+
+
+async def agrade(test, auth_user_id, answer_ids):
+    answer_ids = parse_answer_ids(answer_ids)
+    return grade_key(await main_answerkey.aget_key(test['id']), answer_ids,
+                     await aserved_question_ids(test, auth_user_id))
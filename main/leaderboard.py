@@ -0,0 +1,245 @@
+import logging
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from . import models as main_models
+from . import metrics as main_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class Leaderboard:
+    # Scores are small non-negative integers, so the board keeps a Fenwick tree of how many
+    # profiles hold each score. Rank and percentile are prefix sums over it.
+    def __init__(self, test_id, rows=(), size=64):
+        self.test_id = test_id
+        self.size = size
+        self.tree = [0] * (size + 1)
+        self.scores = {}
+        self.members = {}
+        self.lock = threading.Lock()
+        self.loaded_at = time.monotonic()
+        for profile_id, score in rows:
+            self._insert(profile_id, score)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _update(self, score, delta):
+        index = score + 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def _grow(self, score):
+        size = self.size
+        while score >= size:
+            size *= 2
+        self.size = size
+        self.tree = [0] * (size + 1)
+        for value, members in self.members.items():
+            self._update(value, len(members))
+
+    def _count_at_most(self, score):
+        index = min(score, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def _insert(self, profile_id, score):
+        score = max(0, score)
+        if score >= self.size:
+            self._grow(score)
+        self.scores[profile_id] = score
+        self.members.setdefault(score, set()).add(profile_id)
+        self._update(score, 1)
+
+    def _remove(self, profile_id):
+        score = self.scores.pop(profile_id, None)
+        if score is None:
+            return
+        members = self.members[score]
+        members.discard(profile_id)
+        if not members:
+            del self.members[score]
+        self._update(score, -1)
+
+    def set(self, profile_id, score):
+        with self.lock:
+            if self.scores.get(profile_id) == score:
+                return
+            self._remove(profile_id)
+            self._insert(profile_id, score)
+
+    def add(self, profile_id, delta):
+        with self.lock:
+            score = self.scores.get(profile_id, 0) + delta
+            self._remove(profile_id)
+            self._insert(profile_id, score)
+
+    def discard(self, profile_id):
+        with self.lock:
+            self._remove(profile_id)
+
+    def score(self, profile_id):
+        return self.scores.get(profile_id)
+
+    def rank_for_score(self, score):
+        with self.lock:
+            return len(self.scores) - self._count_at_most(score) + 1
+
+    def rank(self, profile_id):
+        score = self.scores.get(profile_id)
+        if score is None:
+            return None
+        return self.rank_for_score(score)
+
+    def percentile(self, score):
+        with self.lock:
+            if not self.scores:
+                return None
+            return round(100 * self._count_at_most(score) / len(self.scores), 1)
+
+    def top(self, limit):
+        entries = []
+        with self.lock:
+            for score in sorted(self.members, reverse=True):
+                rank = len(entries) + 1
+                for profile_id in sorted(self.members[score]):
+                    entries.append((rank, profile_id, score))
+                if len(entries) >= limit:
+                    break
+        return entries[:limit]
+
+
+_boards = {}
+_rebuilding = set()
+_lock = threading.Lock()
+
+
+def get_refresh_interval():
+    return getattr(settings, 'LEADERBOARD_REFRESH_INTERVAL', 60)
+
+
+def load(test_id):
+    rows = (main_models.UserTestResult.objects.filter(test_id=test_id)
+            .values_list('user_id', 'score').iterator(chunk_size=10000))
+    board = Leaderboard(test_id, rows)
+    logger.info('Loaded leaderboard for test %s: %d profiles', test_id, len(board))
+    main_metrics.set_gauge('leaderboard_profiles', (('test', test_id),), len(board))
+    return board
+
+
+def is_fresh(board):
+    return time.monotonic() - board.loaded_at < get_refresh_interval()
+
+
+def rebuild(test_id):
+    try:
+        _boards[test_id] = load(test_id)
+    except Exception:
+        logger.exception('Could not rebuild leaderboard for test %s', test_id)
+    finally:
+        connections.close_all()
+        with _lock:
+            _rebuilding.discard(test_id)
+
+
+def get_board(test_id):
+    # Boards are per process and updated by the scoring paths in this process. Writes made
+    # by other workers are picked up when the board is rebuilt after the refresh interval.
+    # Only the first load blocks; later rebuilds run in a thread while the old board is served.
+    board = _boards.get(test_id)
+    if board is not None and is_fresh(board):
+        return board
+    with _lock:
+        board = _boards.get(test_id)
+        if board is None:
+            board = _boards[test_id] = load(test_id)
+        elif not is_fresh(board) and test_id not in _rebuilding:
+            _rebuilding.add(test_id)
+            threading.Thread(target=rebuild, args=(test_id,), name=f'leaderboard-{test_id}', daemon=True).start()
+        return board
+
+
+async def aget_board(test_id):
+    # An existing board is returned without touching the database, even while it is rebuilt.
+    if test_id in _boards:
+        return get_board(test_id)
+    return await sync_to_async(get_board)(test_id)
+
+
+def record(test_id, profile_id, score):
+    board = _boards.get(test_id)
+    if board is not None:
+        board.set(profile_id, score)
+
+
+def record_increments(increments):
+    for (profile_id, test_id), delta in increments.items():
+        board = _boards.get(test_id)
+        if board is not None:
+            board.add(profile_id, delta)
+
+
+def record_reset(profile_id):
+    for board in list(_boards.values()):
+        if board.score(profile_id) is not None:
+            board.set(profile_id, 0)
+
+
+def forget(test_id, profile_id):
+    board = _boards.get(test_id)
+    if board is not None:
+        board.discard(profile_id)
+
+
+def describe(test_id, score):
+    return describe_board(get_board(test_id), score)
+
+
+async def adescribe(test_id, score):
+    return describe_board(await aget_board(test_id), score)
+
+
+def describe_board(board, score):
+    return {
+        'rank': board.rank_for_score(score),
+        'percentile': board.percentile(score),
+        'participants': len(board),
+    }
+
+
+def names_queryset(top):
+    return main_models.Profile.objects.filter(id__in=[entry[1] for entry in top]).values_list('id', 'name')
+
+
+def build(test, profile_id, limit):
+    board = get_board(test['id'])
+    top = board.top(limit)
+    return render(test, board, top, dict(names_queryset(top)), profile_id)
+
+
+async def abuild(test, profile_id, limit):
+    board = await aget_board(test['id'])
+    top = board.top(limit)
+    names = {entry_profile_id: name async for entry_profile_id, name in names_queryset(top)}
+    return render(test, board, top, names, profile_id)
+
+
+def render(test, board, top, names, profile_id):
+    score = board.score(profile_id)
+    return {
+        'test_id': test['id'],
+        'test_title': test['title'],
+        'participants': len(board),
+        'top': [{'rank': rank, 'name': names.get(entry_profile_id), 'score': entry_score}
+                for rank, entry_profile_id, entry_score in top],
+        'me': None if score is None else {'score': score, 'rank': board.rank_for_score(score),
+                                          'percentile': board.percentile(score)},
+    }
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import random
+import shutil
+import tempfile
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection, connections
+from main import models as main_models
+from main import scoring
+
+
+PROFILES = {
+    # SQLite's defaults and a fresh connection per request, as before the tuning layer.
+    'baseline': {'PRAGMAS': None, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    # Whatever testing/settings.py configures.
+    'tuned': {},
+}
+
+
+def run_worker(number, keys, options):
+    rng = random.Random(options['seed'] * 1000 + number)
+    result = {'writes': 0, 'reads': 0, 'locked': 0, 'failed': 0, 'latencies': []}
+    for _ in range(options['ops']):
+        profile_id, test_id = rng.choice(keys)
+        write = rng.random() < options['write_ratio']
+        started = time.perf_counter()
+        try:
+            if write:
+                scoring.apply_increments({(profile_id, test_id): 1})
+            else:
+                list(main_models.UserTestResult.objects.filter(user_id=profile_id).values('test_id', 'score'))
+        except OperationalError as e:
+            result['locked' if 'locked' in str(e) else 'failed'] += 1
+        else:
+            result['writes' if write else 'reads'] += 1
+            if write:
+                result['latencies'].append(time.perf_counter() - started)
+        # End of request, as in the request_finished handler.
+        close_old_connections()
+    connections.close_all()
+    return result
+
+
+class Command(BaseCommand):
+    help = ('Measure write throughput and "database is locked" errors of concurrent answer writes '
+            'against a scratch copy of the schema, with SQLite defaults and with the configured tuning.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=[*PROFILES, 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=500, help='Requests per worker.')
+        parser.add_argument('--write-ratio', type=float, default=0.5)
+        parser.add_argument('--profiles', type=int, default=1000, help='Quiz profiles to seed.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        names = list(PROFILES) if options['profile'] == 'both' else [options['profile']]
+        settings_dict = connections.settings['default']
+        original = {key: settings_dict[key] for key in ('NAME', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+        directory = tempfile.mkdtemp(prefix='bench-sqlite-')
+        try:
+            for name in names:
+                # Same approach as the test runner: repoint the alias at a scratch file.
+                connection.close()
+                settings_dict.update(original, NAME=os.path.join(directory, f'{name}.sqlite3'))
+                settings_dict.pop('PRAGMAS', None)
+                settings_dict.update(PROFILES[name])
+                call_command('migrate', database='default', verbosity=0, interactive=False)
+                keys = self.seed(options['profiles'])
+                result = self.run(keys, options)
+                connection.close()
+                self.report(name, result, options)
+        finally:
+            connection.close()
+            settings_dict.pop('PRAGMAS', None)
+            settings_dict.update(original)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def seed(self, count):
+        test = main_models.Test.objects.create(title='bench')
+        users = main_models.User.objects.bulk_create(
+            [main_models.User(username=f'bench-{i}') for i in range(count)])
+        profiles = main_models.Profile.objects.bulk_create(
+            [main_models.Profile(user=user, name=f'bench {i}', phone_number=str(i)) for i, user in enumerate(users)])
+        main_models.UserTestResult.objects.bulk_create(
+            [main_models.UserTestResult(user=profile, test=test, score=0) for profile in profiles])
+        return [(profile.id, test.id) for profile in profiles]
+
+    def run(self, keys, options):
+        # Separate processes, like gunicorn workers, so SQLite's file locks are really contended.
+        connections.close_all()
+        started = time.perf_counter()
+        with multiprocessing.get_context('fork').Pool(options['workers']) as pool:
+            results = pool.starmap(run_worker, [(number, keys, options) for number in range(options['workers'])])
+        result = {'seconds': time.perf_counter() - started, 'writes': 0, 'reads': 0, 'locked': 0, 'failed': 0,
+                  'latencies': []}
+        for local in results:
+            for key, value in local.items():
+                result[key] += value
+        return result
+
+    def report(self, name, result, options):
+        latencies = sorted(result['latencies']) or [0]
+        attempted = options['workers'] * options['ops']
+        self.stdout.write(
+            f'{name:>8}: {result["writes"] / result["seconds"]:7.0f} writes/s, '
+            f'{result["reads"] / result["seconds"]:7.0f} reads/s, '
+            f'{result["locked"]} locked ({100 * result["locked"] / max(attempted, 1):.1f}% of requests), '
+            f'{result["failed"]} other errors, write p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+            f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms '
+            f'({options["workers"]} workers x {options["ops"]} requests, {result["seconds"]:.1f}s)')
@@ -0,0 +1,22 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from main import notifications
+
+
+class Command(BaseCommand):
+    help = 'Deliver pending result notifications from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox.')
+
+    def handle(self, *args, **options):
+        worker = notifications.build_worker()
+        if worker is None:
+            raise CommandError('No notification transport is configured (is TELEGRAM_BOT_TOKEN set?).')
+        while True:
+            worker.drain()
+            self.stdout.write('Sent {sent} notifications in {messages} messages, '
+                              '{retried} retried, {failed} failed'.format(**worker.metrics))
+            if not options['loop']:
+                break
+            time.sleep(worker.interval)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from main import models as main_models
+from main import questionbank
+
+
+class Command(BaseCommand):
+    help = 'Export questions with their answers as JSONL or CSV ("-" or no path writes to stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-')
+        parser.add_argument('--format', choices=questionbank.FORMATS, help='Defaults to the file extension, then jsonl.')
+        parser.add_argument('--test', type=int, help='Only export the questions of this test.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queryset = main_models.Question.objects.all()
+        if options['test'] is not None:
+            queryset = queryset.filter(test=options['test'])
+        fmt = options['format'] or questionbank.guess_format(options['path'])
+
+        if options['path'] == '-':
+            for chunk in questionbank.export_questions(queryset, fmt, options['chunk_size']):
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['path'], 'w', newline='', encoding='utf-8') as f:
+            f.writelines(questionbank.export_questions(queryset, fmt, options['chunk_size']))
+        self.stderr.write(f'Wrote {options["path"]}')
@@ -0,0 +1,36 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from main import models as main_models
+from main import questionbank
+
+
+class Command(BaseCommand):
+    help = 'Import questions with their answers from a JSONL or CSV file ("-" reads stdin).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=questionbank.FORMATS, help='Defaults to the file extension, then jsonl.')
+        parser.add_argument('--test', type=int, action='append', default=[], dest='tests',
+                            help='Add the imported questions to this test. Can be repeated.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        test_ids = options['tests']
+        unknown = set(test_ids) - set(main_models.Test.objects.filter(id__in=test_ids).values_list('id', flat=True))
+        if unknown:
+            raise CommandError(f'Unknown test ids: {", ".join(map(str, sorted(unknown)))}')
+
+        fmt = options['format'] or questionbank.guess_format(options['path'])
+        stream = sys.stdin if options['path'] == '-' else open(options['path'], newline='', encoding='utf-8')
+
+        def progress(questions, answers, elapsed):
+            self.stdout.write(f'{questions} questions, {answers} answers '
+                              f'({questions / elapsed if elapsed else 0:.0f} questions/s)')
+
+        try:
+            with stream:
+                questions, answers = questionbank.import_questions(
+                    questionbank.parse(stream, fmt), test_ids, options['chunk_size'], progress)
+        except questionbank.QuestionBankError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Imported {questions} questions and {answers} answers'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from main import retention
+
+
+class Command(BaseCommand):
+    help = 'Delete (or with --rotate, archive) error logs older than ERROR_RETENTION days and compact errors_db.'
+
+    def add_arguments(self, parser):
+        config = retention.get_config()
+        parser.add_argument('--days', type=int, default=config['days'])
+        parser.add_argument('--batch-size', type=int, default=config['batch_size'])
+        parser.add_argument('--pause', type=float, default=config['pause'],
+                            help='Seconds to sleep between delete batches.')
+        parser.add_argument('--rotate', action='store_true', default=config['rotate'],
+                            help='Copy expired rows into monthly archive files before deleting them.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed.')
+        parser.add_argument('--no-vacuum', action='store_true', help='Skip the incremental vacuum.')
+        parser.add_argument('--convert', action='store_true',
+                            help='Switch errors_db to auto_vacuum=INCREMENTAL with a one-off full VACUUM.')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        config = dict(retention.get_config(), days=options['days'], batch_size=options['batch_size'],
+                      pause=options['pause'], rotate=options['rotate'])
+        cutoff = retention.get_cutoff(config['days'])
+        action, done = ('archive and delete', 'Archived and deleted') if config['rotate'] else ('delete', 'Deleted')
+
+        if options['dry_run']:
+            for model, months in retention.preview(cutoff):
+                total = sum(rows for _, rows in months)
+                self.stdout.write(f'Would {action} {total} {model._meta.verbose_name_plural} older than {cutoff:%Y-%m-%d}')
+                for month, rows in months:
+                    self.stdout.write(f'  {month:%Y-%m}: {rows}')
+            self.stdout.write('Free pages: {}, auto_vacuum: {}'.format(
+                retention.get_pragma('errors_db', 'freelist_count'), retention.get_pragma('errors_db', 'auto_vacuum')))
+            return
+
+        for model, field in retention.get_targets():
+            result = retention.prune(model, field, cutoff, config, progress=self.report_progress)
+            rate = result['deleted'] / result['seconds'] if result['seconds'] else 0
+            self.stdout.write(f'{done} {result["deleted"]} {model._meta.verbose_name_plural} '
+                              f'in {result["batches"]} batches, {result["seconds"]:.2f}s ({rate:.0f} rows/s)')
+
+        if not options['no_vacuum']:
+            result = retention.compact('errors_db', config['vacuum_pages'], options['convert'])
+            if result is not None:
+                freed = result['free_pages_before'] - result['free_pages_after']
+                self.stdout.write(f'auto_vacuum={result["mode"]}: released {freed} pages '
+                                  f'({freed * result["page_size"] / 1e6:.1f} MB), {result["free_pages_after"]} still free')
+
+    def report_progress(self, model, deleted, seconds):
+        if self.verbosity > 1:
+            self.stdout.write(f'  {model._meta.verbose_name_plural}: {deleted} rows after {seconds:.2f}s')
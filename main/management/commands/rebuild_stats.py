@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from main import models as main_models
+from main import stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute ProfileStats and Test.question_count from the result and question tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report profiles whose stored stats differ; exit non-zero if any do.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = stats.check(options['batch_size'])
+            for profile_id, have, want in mismatches[:50]:
+                self.stdout.write(f'Profile {profile_id}: stored {have}, expected {want}')
+            stale_tests = [test for test in main_models.Test.objects.annotate(actual=Count('questions'))
+                           if test.actual != test.question_count]
+            for test in stale_tests:
+                self.stdout.write(f'Test {test.id}: stored {test.question_count} questions, expected {test.actual}')
+            if mismatches or stale_tests:
+                raise CommandError(f'{len(mismatches)} profiles and {len(stale_tests)} tests are out of date')
+            self.stdout.write('Stats are consistent')
+            return
+
+        tests = main_models.Test.refresh_question_counts()
+        profiles = stats.rebuild(options['batch_size'])
+        self.stdout.write(f'Rebuilt stats for {profiles} profiles and question counts for {tests} tests')
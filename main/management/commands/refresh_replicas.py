@@ -0,0 +1,27 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from main import database
+
+
+class Command(BaseCommand):
+    help = 'Copy the default database into every DATABASE_REPLICAS alias with the SQLite backup API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Keep refreshing every DATABASE_REPLICA_REFRESH_INTERVAL seconds.')
+        parser.add_argument('--pages', type=int, default=-1,
+                            help='Pages copied per backup step; -1 copies everything in one step.')
+
+    def handle(self, *args, **options):
+        replicas = database.get_replicas()
+        if not replicas:
+            raise CommandError('No replicas configured; set DB_REPLICAS or DATABASE_REPLICAS.')
+        while True:
+            for alias in replicas:
+                started = time.monotonic()
+                database.refresh_replica(alias, options['pages'])
+                self.stdout.write(f'Refreshed {alias} in {time.monotonic() - started:.3f}s')
+            if not options['loop']:
+                break
+            time.sleep(getattr(settings, 'DATABASE_REPLICA_REFRESH_INTERVAL', 30))
@@ -0,0 +1,177 @@
+import os
+import heapq
+import threading
+import time
+import logging
+from django.conf import settings
+from . import metrics as main_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class MediaExpiryIndex:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.heap = []
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.mtimes)
+
+    def track(self, path, mtime=None):
+        if mtime is None:
+            mtime = os.stat(path).st_mtime
+        with self.lock:
+            if self.mtimes.get(path) == mtime:
+                return
+            self.mtimes[path] = mtime
+            heapq.heappush(self.heap, (mtime, path))
+
+    def forget(self, path):
+        with self.lock:
+            self.mtimes.pop(path, None)
+
+    def pop_due(self, now=None):
+        if now is None:
+            now = time.time()
+        deadline = now - self.ttl
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] < deadline:
+                mtime, path = heapq.heappop(self.heap)
+                # Stale heap entries are left behind when a file is re-tracked or forgotten.
+                if self.mtimes.get(path) == mtime:
+                    del self.mtimes[path]
+                    due.append(path)
+        return due
+
+
+class MediaSweeper:
+    def __init__(self, root, ttl, interval, rescan_interval):
+        self.root = root
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.index = MediaExpiryIndex(ttl)
+        self.last_scan = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.metrics = {
+            'sweeps': 0,
+            'scans': 0,
+            'files_scanned': 0,
+            'files_deleted': 0,
+            'errors': 0,
+            'tracked': 0,
+            'last_sweep_seconds': 0.0,
+        }
+
+    def count(self, name, value=1):
+        self.metrics[name] += value
+        main_metrics.inc(f'media_{name}_total', (), value)
+
+    def scan(self):
+        scanned = 0
+        stack = [self.root]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        scanned += 1
+                        self.index.track(entry.path, entry.stat(follow_symlinks=False).st_mtime)
+        self.count('scans')
+        self.count('files_scanned', scanned)
+        self.last_scan = time.monotonic()
+        return scanned
+
+    def delete_due(self, now=None):
+        deleted = 0
+        for path in self.index.pop_due(now):
+            try:
+                mtime = os.stat(path).st_mtime
+                if mtime >= (now or time.time()) - self.index.ttl:
+                    self.index.track(path, mtime)
+                    continue
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                continue
+            except OSError:
+                self.count('errors')
+                logger.exception('Could not delete expired media file %s', path)
+        self.count('files_deleted', deleted)
+        return deleted
+
+    def sweep(self, now=None):
+        # Between full scans only the expiry heap is consulted, so files added since the last scan
+        # are found, and expire, up to rescan_interval late.
+        started = time.perf_counter()
+        scanned = 0
+        if self.last_scan is None or time.monotonic() - self.last_scan >= self.rescan_interval:
+            scanned = self.scan()
+        deleted = self.delete_due(now)
+        self.count('sweeps')
+        self.metrics['tracked'] = len(self.index)
+        self.metrics['last_sweep_seconds'] = time.perf_counter() - started
+        main_metrics.set_gauge('media_tracked_files', (), self.metrics['tracked'])
+        main_metrics.set_gauge('media_last_sweep_seconds', (), self.metrics['last_sweep_seconds'])
+        return {'scanned': scanned, 'deleted': deleted, 'tracked': self.metrics['tracked'],
+                'seconds': self.metrics['last_sweep_seconds']}
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception:
+                self.count('errors')
+                logger.exception('Media sweep failed')
+            self.stop_event.wait(self.interval)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='media-sweeper', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+_sweeper = None
+_sweeper_lock = threading.Lock()
+
+
+def build_sweeper():
+    return MediaSweeper(
+        root=settings.MEDIA_ROOT,
+        ttl=getattr(settings, 'MEDIA_FILE_TTL', 10),
+        interval=getattr(settings, 'MEDIA_SWEEP_INTERVAL', 5),
+        rescan_interval=getattr(settings, 'MEDIA_RESCAN_INTERVAL', 60),
+    )
+
+
+def get_sweeper():
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is None:
+            _sweeper = build_sweeper()
+        return _sweeper
+
+
+def start_sweeper():
+    sweeper = get_sweeper()
+    sweeper.start()
+    return sweeper
+
+
+def track(path):
+    get_sweeper().index.track(path)
@@ -0,0 +1,228 @@
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+QUANTILES = (0.5, 0.9, 0.99)
+SNAPSHOT_FILE = re.compile(r'metrics-(\d+)\.json')
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        index = 0
+        while value > self.buckets[index]:
+            index += 1
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(self.buckets) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, labels, value):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'histograms': [[name, list(labels), list(values)] for (name, labels), values in self.histograms.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+            }
+
+
+class FileExporter:
+    def __init__(self, registry, directory, interval, max_age=600):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.max_age = max_age
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f'metrics-{self.pid}.json')
+        self.last_write = 0.0
+        atexit.register(self.write)
+
+    def maybe_write(self):
+        if time.monotonic() - self.last_write >= self.interval:
+            self.write()
+
+    def write(self):
+        self.last_write = time.monotonic()
+        os.makedirs(self.directory, exist_ok=True)
+        # Background writers (e.g. the error log) also report metrics, so each thread gets its own file.
+        tmp_path = f'{self.path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, self.path)
+
+    def is_alive(self, pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def is_current(self, path, pid):
+        # Files of exited workers are removed. A file that has not been rewritten within max_age
+        # is skipped: its pid may belong to an unrelated process by now.
+        if not self.is_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) < self.max_age
+        except OSError:
+            return False
+
+    def collect(self):
+        merged_histograms = {}
+        merged_counters = {}
+        merged_gauges = {}
+        snapshots = [self.registry.snapshot()]
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                path = os.path.join(self.directory, filename)
+                match = SNAPSHOT_FILE.fullmatch(filename)
+                if match is None or path == self.path or not self.is_current(path, int(match.group(1))):
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        for snapshot in snapshots:
+            for name, labels, values in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                current = merged_histograms.get(key)
+                merged_histograms[key] = values if current is None else [a + b for a, b in zip(current, values)]
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                merged_counters[key] = merged_counters.get(key, 0) + value
+            # Gauges are per-worker quantities such as memory use, so the total is their sum.
+            for name, labels, value in snapshot.get('gauges', []):
+                key = (name, tuple(tuple(label) for label in labels))
+                merged_gauges[key] = merged_gauges.get(key, 0) + value
+        return merged_histograms, merged_counters, merged_gauges
+
+
+def quantile(buckets, counts, q):
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    lower = 0.0
+    for upper, count in zip(buckets, counts):
+        if seen + count >= rank:
+            if upper == float('inf'):
+                return lower
+            return lower + (upper - lower) * ((rank - seen) / count if count else 0)
+        seen += count
+        lower = upper
+    return lower
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = ('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in pairs)
+    return '{' + ','.join(escaped) + '}'
+
+
+def render(buckets, histograms, counters, gauges):
+    lines = []
+    seen_types = set()
+    for (name, labels), values in sorted(histograms.items()):
+        counts, total = values[:-1], values[-1]
+        if name not in seen_types:
+            seen_types.add(name)
+            lines.append(f'# TYPE {name} histogram')
+        cumulative = 0
+        for upper, count in zip(buckets, counts):
+            cumulative += count
+            le = '+Inf' if upper == float('inf') else repr(upper)
+            lines.append(f'{name}_bucket{format_labels(labels, le=le)} {cumulative}')
+        lines.append(f'{name}_sum{format_labels(labels)} {total}')
+        lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    for (name, labels), values in sorted(histograms.items()):
+        quantile_name = f'{name}_quantile'
+        if quantile_name not in seen_types:
+            seen_types.add(quantile_name)
+            lines.append(f'# TYPE {quantile_name} gauge')
+        for q in QUANTILES:
+            lines.append(f'{quantile_name}{format_labels(labels, quantile=q)} {quantile(buckets, values[:-1], q):.6f}')
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen_types:
+            seen_types.add(name)
+            lines.append(f'# TYPE {name} counter')
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        if name not in seen_types:
+            seen_types.add(name)
+            lines.append(f'# TYPE {name} gauge')
+        lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    global _exporter
+    if _exporter is None or _exporter.pid != os.getpid():
+        with _exporter_lock:
+            if _exporter is None or _exporter.pid != os.getpid():
+                _exporter = FileExporter(
+                    registry,
+                    directory=getattr(settings, 'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'testing-metrics')),
+                    interval=getattr(settings, 'METRICS_FLUSH_INTERVAL', 5),
+                    max_age=getattr(settings, 'METRICS_MAX_AGE', 600),
+                )
+    return _exporter
+
+
+def observe(name, labels, value):
+    registry.observe(name, labels, value)
+    get_exporter().maybe_write()
+
+
+def inc(name, labels, value=1):
+    registry.inc(name, labels, value)
+    get_exporter().maybe_write()
+
+
+def set_gauge(name, labels, value):
+    registry.set_gauge(name, labels, value)
+    get_exporter().maybe_write()
+
+
+def export():
+    histograms, counters, gauges = get_exporter().collect()
+    return render(registry.buckets, histograms, counters, gauges)
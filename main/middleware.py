@@ -47,42 +47,113 @@
 
 
 
-import os
-import time
-import gzip
-from io import BytesIO
-from datetime import datetime
+import logging
+from time import perf_counter
+from contextlib import ExitStack
 from django.middleware.csrf import CsrfViewMiddleware
 from django.db import DatabaseError
 from django.http import HttpResponseBadRequest
 from django.utils.deprecation import MiddlewareMixin
-from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from . import media
+from . import metrics
+from . import queries
+from . import compression
+from . import database
+
+logger = logging.getLogger(__name__)
 
 class DeleteOldMediaMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.sweeper = media.start_sweeper()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        self.delete_old_files()
         response = self.get_response(request)
         return response
 
-    def delete_old_files(self):
-        for root, dirs, files in os.walk(settings.MEDIA_ROOT):
-            for file in files:
-                filepath = os.path.join(root, file)
-                if os.stat(filepath).st_mtime < time.time() - 10:
-                    os.remove(filepath)
+class ReadYourWritesMiddleware:
+    # Opens the scope in which main.database.PrimaryReplicaRouter may read from replicas. Once
+    # a request writes, its remaining reads and the client's next requests go to the primary.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with database.request_scope(database.client_key(request)):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with database.request_scope(database.client_key(request)):
+            return await self.get_response(request)
 
 class RequestTimeMiddleware(MiddlewareMixin):
     def process_request(self, request):
-        request.start_time = datetime.now()
+        request.start_time = perf_counter()
         return None
 
     def process_response(self, request, response):
         if hasattr(request, 'start_time'):
-            duration = datetime.now() - request.start_time
-            print(f"Request to {request.path} took {duration.total_seconds()} seconds. Project name: Pyblog. Domen: https://pyblog.uz")
+            duration = perf_counter() - request.start_time
+            resolver_match = getattr(request, 'resolver_match', None)
+            route = resolver_match.route if resolver_match is not None else '<unmatched>'
+            metrics.observe('http_request_duration_seconds',
+                            (('route', route), ('method', request.method), ('status', response.status_code)),
+                            duration)
+        return response
+    
+
+class QueryCountMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.config = queries.get_config()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # Async views run their queries in sync_to_async threads whose connections the
+        # execute_wrapper cannot see, so accounting only applies to the sync stack.
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        if not queries.should_sample(self.config['sample_rate']):
+            return self.get_response(request)
+
+        recorder = queries.QueryRecorder()
+        with ExitStack() as stack:
+            recorder.install(stack)
+            response = self.get_response(request)
+
+        repeated = recorder.repeated(self.config['repeat_threshold'])
+        if self.config['headers']:
+            response['X-DB-Queries'] = ';'.join(f'{alias}={stats[0]}' for alias, stats in recorder.aliases.items()) or '0'
+            response['X-DB-Time-ms'] = f'{recorder.duration * 1000:.2f}'
+            response['X-DB-Repeated-Queries'] = str(len(repeated))
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.route if resolver_match is not None else '<unmatched>'
+        metrics.inc('db_sampled_requests_total', (('route', route),))
+        for alias, (count, duration) in recorder.aliases.items():
+            metrics.inc('db_queries_total', (('route', route), ('alias', alias)), count)
+            metrics.inc('db_query_seconds_total', (('route', route), ('alias', alias)), duration)
+        if repeated:
+            metrics.inc('db_repeated_query_shapes_total', (('route', route),), len(repeated))
+            for (alias, sql), count in repeated.items():
+                logger.warning('Query ran %d times on %s during %s %s: %s', count, alias, request.method, request.path, sql)
         return response
     
 
@@ -101,45 +172,124 @@ class SecurityMiddleware(CsrfViewMiddleware):
 
 
 class GZipMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.config = compression.get_config()
+        self.cache = compression.CompressedBodyCache(self.config['cache_entries'],
+                                                     self.config['cache_max_body_size'])
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
 
-        if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
-            if 'text' in response.get('Content-Type', ''):
-                gzip_buffer = BytesIO()
-                with gzip.GzipFile(mode='wb', fileobj=gzip_buffer) as gzip_file:
-                    gzip_file.write(response.content)
-                response.content = gzip_buffer.getvalue()
-                response['Content-Encoding'] = 'gzip'
-                response['Content-Length'] = str(len(response.content))
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
 
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if not compression.is_compressible(response.get('Content-Type', '')):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not compression.ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        level = self.config['level']
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compression.acompress_stream(response.streaming_content, level)
+            else:
+                response.streaming_content = compression.compress_stream(response.streaming_content, level)
+            del response['Content-Length']
+        else:
+            content = response.content
+            if len(content) < self.config['min_length']:
+                return response
+            if compression.is_cacheable(response):
+                key = compression.cache_key(request.path, content, response.get('ETag'), level)
+                compressed = self.cache.get(key)
+                if compressed is None:
+                    compressed = compression.compress(content, level)
+                    self.cache.set(key, compressed)
+            else:
+                compressed = compression.compress(content, level)
+            if len(compressed) >= len(content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'gzip'
         return response
     
 from django.http import HttpResponse
-from collections import defaultdict
-from time import time
+from django.urls import Resolver404, resolve
+from . import ratelimit
 
 class RateLimitMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response, capacity=100, refill_interval=60):
         self.get_response = get_response
-        self.capacity = capacity  
-        self.refill_interval = refill_interval 
-        self.tokens = defaultdict(lambda: (self.capacity, time()))
+        self.limiter = ratelimit.build_limiter(default=(capacity, refill_interval))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        # Only the shared store does network I/O; in async mode keep it off the event loop.
+        self.shared_store = not isinstance(self.limiter.store, ratelimit.LocalStore)
+
+    def url_name(self, request):
+        # Middleware runs before URL resolution, so resolve here to key limits on the route name.
+        try:
+            return resolve(request.path_info).url_name
+        except Resolver404:
+            return None
 
-    def __call__(self, request):
-        ip = request.META.get('REMOTE_ADDR')
-        tokens, last_refill_time = self.tokens[ip]
+    def check(self, request):
+        try:
+            return self.limiter.check(request.META.get('REMOTE_ADDR'), request.path, self.url_name(request))
+        except Exception:
+            logger.exception('Rate limit store unavailable, letting request through')
+            return None
+
+    def rejected(self, retry_after):
+        response = HttpResponse('Rate limit exceeded', status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
 
-        current_time = time()
-        if current_time - last_refill_time > self.refill_interval:
-            self.tokens[ip] = (self.capacity, current_time)
-            tokens = self.capacity
+    def add_headers(self, response, limit, remaining):
+        response['X-RateLimit-Limit'] = str(limit)
+        response['X-RateLimit-Remaining'] = str(remaining)
+        return response
 
-        if tokens > 0:
-            self.tokens[ip] = (tokens - 1, last_refill_time)
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        result = self.check(request)
+        if result is None:
             return self.get_response(request)
+
+        allowed, limit, remaining, retry_after = result
+        response = self.get_response(request) if allowed else self.rejected(retry_after)
+        return self.add_headers(response, limit, remaining)
+
+    async def __acall__(self, request):
+        if self.shared_store:
+            result = await sync_to_async(self.check, thread_sensitive=False)(request)
         else:
-            return HttpResponse('Rate limit exceeded', status=429)
\ No newline at end of file
+            result = self.check(request)
+        if result is None:
+            return await self.get_response(request)
+
+        allowed, limit, remaining, retry_after = result
+        response = await self.get_response(request) if allowed else self.rejected(retry_after)
+        return self.add_headers(response, limit, remaining)
@@ -0,0 +1,95 @@
+# Generated by Django 4.2 on 2026-10-18 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_alter_usertestresult_score"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="usertestresult",
+            name="attempt",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name="NotificationOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("attempt", models.PositiveIntegerField()),
+                ("chat_id", models.CharField(max_length=64)),
+                ("text", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("sending", "Sending"),
+                            ("sent", "Sent"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("tries", models.PositiveIntegerField(default=0)),
+                (
+                    "next_attempt_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("claim", models.CharField(blank=True, max_length=32)),
+                ("last_error", models.TextField(blank=True)),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="Created At"),
+                ),
+                ("sent_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "profile",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="main.profile",
+                    ),
+                ),
+                (
+                    "result",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="notifications",
+                        to="main.usertestresult",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Notification",
+                "verbose_name_plural": "Notification Outbox",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="notificationoutbox",
+            index=models.Index(
+                fields=["status", "next_attempt_at"],
+                name="main_notifi_status_588eeb_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="notificationoutbox",
+            constraint=models.UniqueConstraint(
+                fields=("result", "attempt"), name="unique_notification_per_attempt"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_notificationoutbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ErrorGroup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=16, unique=True)),
+                ("exception_type", models.CharField(max_length=100)),
+                ("view", models.CharField(max_length=100)),
+                ("message", models.TextField()),
+                ("count", models.PositiveBigIntegerField(default=0)),
+                ("first_seen", models.DateTimeField(verbose_name="First Seen")),
+                ("last_seen", models.DateTimeField(verbose_name="Last Seen")),
+            ],
+            options={
+                "verbose_name": "Error Group",
+                "verbose_name_plural": "Error Groups",
+            },
+        ),
+        migrations.AddField(
+            model_name="errorlog",
+            name="fingerprint",
+            field=models.CharField(blank=True, db_index=True, max_length=16),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 18:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_errorgroup"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="test",
+            name="sample_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Serve this many randomly drawn questions. Leave empty to serve all.",
+                null=True,
+                verbose_name="Questions per attempt",
+            ),
+        ),
+    ]
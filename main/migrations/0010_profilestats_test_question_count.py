@@ -0,0 +1,66 @@
+# Generated by Django 4.2 on 2026-10-18 19:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    Test = apps.get_model("main", "Test")
+    UserTestResult = apps.get_model("main", "UserTestResult")
+    ProfileStats = apps.get_model("main", "ProfileStats")
+    for test in Test.objects.annotate(count=models.Count("questions")):
+        Test.objects.filter(pk=test.pk).update(question_count=test.count)
+    rows = (
+        UserTestResult.objects.order_by()
+        .values("user_id")
+        .annotate(tests=models.Count("id"), total=models.Sum("score"))
+    )
+    ProfileStats.objects.bulk_create(
+        [
+            ProfileStats(
+                profile_id=row["user_id"],
+                tests_taken=row["tests"],
+                total_score=row["total"] or 0,
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_test_sample_size"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileStats",
+            fields=[
+                (
+                    "profile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to="main.profile",
+                    ),
+                ),
+                ("tests_taken", models.PositiveIntegerField(default=0)),
+                ("total_score", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Profile Stats",
+                "verbose_name_plural": "Profile Stats",
+            },
+        ),
+        migrations.AddField(
+            model_name="test",
+            name="question_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 19:06
+
+import re
+
+from django.db import migrations, models
+
+
+def fill_normalized_phone(apps, schema_editor):
+    Profile = apps.get_model("main", "Profile")
+    seen = set()
+    batch = []
+    for profile in Profile.objects.order_by("id").only("id", "name", "phone_number"):
+        normalized = re.sub(r"\D", "", profile.phone_number)[:32]
+        # Profiles that only differ in phone formatting keep the oldest one as the match.
+        if (normalized, profile.name) in seen:
+            continue
+        seen.add((normalized, profile.name))
+        profile.normalized_phone = normalized
+        batch.append(profile)
+    Profile.objects.bulk_update(batch, ["normalized_phone"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_profilestats_test_question_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="normalized_phone",
+            field=models.CharField(
+                blank=True, editable=False, max_length=32, null=True
+            ),
+        ),
+        migrations.RunPython(fill_normalized_phone, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="profile",
+            constraint=models.UniqueConstraint(
+                fields=("normalized_phone", "name"), name="unique_profile_identity"
+            ),
+        ),
+    ]
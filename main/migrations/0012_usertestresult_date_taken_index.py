@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_profile_normalized_phone"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="usertestresult",
+            index=models.Index(
+                fields=["date_taken"], name="main_userte_date_ta_8146d0_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2 on 2026-10-18 19:14
+
+from django.db import migrations, models
+
+# External-content FTS5 index over ErrorLog messages, kept in sync by triggers. SQLite
+# drops triggers when Django rebuilds a table, so a later migration that alters
+# main_errorlog columns has to re-run FORWARD_SQL.
+FORWARD_SQL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS main_errorlog_fts USING fts5(
+        error_message, user_agent, ip_address, content='main_errorlog', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_errorlog_fts_insert AFTER INSERT ON main_errorlog BEGIN
+        INSERT INTO main_errorlog_fts(rowid, error_message, user_agent, ip_address)
+        VALUES (new.id, new.error_message, new.user_agent, new.ip_address);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_errorlog_fts_delete AFTER DELETE ON main_errorlog BEGIN
+        INSERT INTO main_errorlog_fts(main_errorlog_fts, rowid, error_message, user_agent, ip_address)
+        VALUES ('delete', old.id, old.error_message, old.user_agent, old.ip_address);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS main_errorlog_fts_update AFTER UPDATE ON main_errorlog BEGIN
+        INSERT INTO main_errorlog_fts(main_errorlog_fts, rowid, error_message, user_agent, ip_address)
+        VALUES ('delete', old.id, old.error_message, old.user_agent, old.ip_address);
+        INSERT INTO main_errorlog_fts(rowid, error_message, user_agent, ip_address)
+        VALUES (new.id, new.error_message, new.user_agent, new.ip_address);
+    END
+    """,
+    "INSERT INTO main_errorlog_fts(main_errorlog_fts) VALUES ('rebuild')",
+]
+
+REVERSE_SQL = [
+    "DROP TRIGGER IF EXISTS main_errorlog_fts_insert",
+    "DROP TRIGGER IF EXISTS main_errorlog_fts_delete",
+    "DROP TRIGGER IF EXISTS main_errorlog_fts_update",
+    "DROP TABLE IF EXISTS main_errorlog_fts",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0012_usertestresult_date_taken_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="errorlog",
+            index=models.Index(fields=["error_number"], name="main_errorl_error_n_idx"),
+        ),
+        migrations.RunPython(
+            run(FORWARD_SQL), run(REVERSE_SQL), hints={"model_name": "errorlog"}
+        ),
+    ]
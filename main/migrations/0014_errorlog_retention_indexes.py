@@ -0,0 +1,21 @@
+# Generated by Django 4.2 on 2026-10-18 19:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0013_errorlog_fts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="errorgroup",
+            index=models.Index(fields=["last_seen"], name="main_errorg_last_se_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="errorlog",
+            index=models.Index(fields=["created_at"], name="main_errorl_created_idx"),
+        ),
+    ]
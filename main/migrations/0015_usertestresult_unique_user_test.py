@@ -0,0 +1,44 @@
+# Generated by Django 4.2 on 2026-10-18 21:40
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def merge_duplicate_results(apps, schema_editor):
+    UserTestResult = apps.get_model("main", "UserTestResult")
+    duplicates = (
+        UserTestResult.objects.values("user_id", "test_id")
+        .annotate(rows=Count("id"), total=Sum("score"), last_attempt=Max("attempt"))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        rows = UserTestResult.objects.filter(
+            user_id=duplicate["user_id"], test_id=duplicate["test_id"]
+        ).order_by("id")
+        # Keep the oldest row carrying the combined score of all of them.
+        keep = rows.first()
+        rows.exclude(id=keep.id).delete()
+        keep.score = duplicate["total"]
+        keep.attempt = duplicate["last_attempt"]
+        keep.save(update_fields=["score", "attempt"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0014_errorlog_retention_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_results, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name="usertestresult",
+            name="main_userte_user_id_634ada_idx",
+        ),
+        migrations.AddConstraint(
+            model_name="usertestresult",
+            constraint=models.UniqueConstraint(
+                fields=("user", "test"), name="unique_user_test_result"
+            ),
+        ),
+    ]
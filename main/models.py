@@ -1,19 +1,36 @@
+import re
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100, verbose_name='Name: ')
     phone_number = models.CharField(max_length=100, verbose_name='Phone number: ')
+    normalized_phone = models.CharField(max_length=32, null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
 
     class Meta:
         verbose_name = 'Profile'
         verbose_name_plural = 'Profiles'
+        constraints = [
+            models.UniqueConstraint(fields=['normalized_phone', 'name'], name='unique_profile_identity'),
+        ]
 
     def __str__(self):
         return f'{self.name} {self.phone_number}'
 
+    @staticmethod
+    def normalize_phone(phone_number):
+        return re.sub(r'\D', '', str(phone_number))[:32]
+
+    def save(self, *args, **kwargs):
+        self.normalized_phone = self.normalize_phone(self.phone_number)
+        if kwargs.get('update_fields') is not None and 'phone_number' in kwargs['update_fields']:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'normalized_phone'}
+        super().save(*args, **kwargs)
+
 class Question(models.Model):
     text = models.TextField()
 
@@ -42,6 +59,9 @@ class Answer(models.Model):
 class Test(models.Model):
     title = models.CharField(max_length=100)
     questions = models.ManyToManyField(Question)
+    sample_size = models.PositiveIntegerField(null=True, blank=True, verbose_name='Questions per attempt',
+                                              help_text='Serve this many randomly drawn questions. Leave empty to serve all.')
+    question_count = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         verbose_name = 'Test'
@@ -53,37 +73,152 @@ class Test(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def served_question_count(self):
+        if self.sample_size:
+            return min(self.sample_size, self.question_count)
+        return self.question_count
+
+    @classmethod
+    def refresh_question_counts(cls, test_ids=None):
+        queryset = cls.objects.all() if test_ids is None else cls.objects.filter(id__in=test_ids)
+        counts = cls.questions.through.objects.filter(test_id=models.OuterRef('pk')).order_by().values(
+            'test_id').annotate(count=models.Count('*')).values('count')
+        return queryset.update(question_count=Coalesce(models.Subquery(counts), 0))
+
 class UserTestResult(models.Model):
     user = models.ForeignKey(Profile, related_name='test_results', on_delete=models.CASCADE)
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
     score = models.PositiveIntegerField()
+    attempt = models.PositiveIntegerField(default=1)
     date_taken = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         verbose_name = 'User Test Result'
         verbose_name_plural = 'User Test Results'
         indexes = [
-            models.Index(fields=['user', 'test']),
+            models.Index(fields=['date_taken']),
+        ]
+        constraints = [
+            # Also serves the (user, test) lookups the plain index used to.
+            models.UniqueConstraint(fields=['user', 'test'], name='unique_user_test_result'),
         ]
 
+    @classmethod
+    def get_attempt_seed(cls, auth_user_id, test_id):
+        attempt = cls.objects.filter(user__user_id=auth_user_id, test_id=test_id).values_list(
+            'attempt', flat=True).first() or 0
+        return f'{auth_user_id}:{test_id}:{attempt}'
+
+    @classmethod
+    async def aget_attempt_seed(cls, auth_user_id, test_id):
+        attempt = await cls.objects.filter(user__user_id=auth_user_id, test_id=test_id).values_list(
+            'attempt', flat=True).afirst() or 0
+        return f'{auth_user_id}:{test_id}:{attempt}'
+
     @classmethod
     def get_user_test_scores(cls, user_id):
         return cls.objects.filter(user_id=user_id).select_related('test').values('test__title', 'score')
 
     @classmethod
     def get_user_test_count(cls, user_id):
-        return cls.objects.filter(user_id=user_id).count()
+        stats = ProfileStats.objects.filter(profile_id=user_id).first()
+        return stats.tests_taken if stats else 0
 
     @classmethod
     def get_user_test_avg_score(cls, user_id):
-        return cls.objects.filter(user_id=user_id).aggregate(models.Avg('score'))
+        stats = ProfileStats.objects.filter(profile_id=user_id).first()
+        return {'score__avg': stats.average_score if stats else None}
+
+class ProfileStats(models.Model):
+    profile = models.OneToOneField(Profile, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    tests_taken = models.PositiveIntegerField(default=0)
+    total_score = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Profile Stats'
+        verbose_name_plural = 'Profile Stats'
+
+    def __str__(self):
+        return f'{self.profile_id}: {self.tests_taken} tests, {self.total_score} points'
+
+    @property
+    def average_score(self):
+        if not self.tests_taken:
+            return None
+        return self.total_score / self.tests_taken
+
+class NotificationOutbox(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+
+    profile = models.ForeignKey(Profile, related_name='notifications', on_delete=models.CASCADE)
+    result = models.ForeignKey(UserTestResult, related_name='notifications', on_delete=models.CASCADE)
+    attempt = models.PositiveIntegerField()
+    chat_id = models.CharField(max_length=64)
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    tries = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Created At')
+    sent_at = models.DateTimeField(null=True, blank=True)
 
-class ErrorsDBManager(models.Manager):
-    def get_queryset(self):
-        return super().get_queryset().using('errors_db')
+    class Meta:
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notification Outbox'
+        constraints = [
+            models.UniqueConstraint(fields=['result', 'attempt'], name='unique_notification_per_attempt'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.profile_id} #{self.attempt} ({self.status})'
+
+class ErrorGroup(models.Model):
+    fingerprint = models.CharField(max_length=16, unique=True)
+    exception_type = models.CharField(max_length=100)
+    view = models.CharField(max_length=100)
+    message = models.TextField()
+    count = models.PositiveBigIntegerField(default=0)
+    first_seen = models.DateTimeField(verbose_name='First Seen')
+    last_seen = models.DateTimeField(verbose_name='Last Seen')
+
+    class Meta:
+        verbose_name = "Error Group"
+        verbose_name_plural = "Error Groups"
+        indexes = [
+            models.Index(fields=['last_seen'], name='main_errorg_last_se_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.exception_type} in {self.view}'
+
+    @classmethod
+    def resolve(cls, error_number):
+        fingerprint = ErrorLog.objects.filter(error_number=error_number).values_list('fingerprint', flat=True).first()
+        if fingerprint:
+            return cls.objects.filter(fingerprint=fingerprint).first()
+        prefix = error_number.split('-')[0]
+        if len(prefix) != 8:
+            return None
+        return cls.objects.filter(fingerprint__startswith=prefix).first()
 
 class ErrorLog(models.Model):
     error_number = models.CharField(max_length=100)
+    fingerprint = models.CharField(max_length=16, blank=True, db_index=True)
     error_message = models.TextField()
     user_agent = models.CharField(max_length=255)
     ip_address = models.CharField(max_length=50)
@@ -92,8 +227,10 @@ class ErrorLog(models.Model):
     class Meta:
         verbose_name = "Error Log"
         verbose_name_plural = "Error Logs"
-
-    objects = ErrorsDBManager()
+        indexes = [
+            models.Index(fields=['error_number'], name='main_errorl_error_n_idx'),
+            models.Index(fields=['created_at'], name='main_errorl_created_idx'),
+        ]
 
     def __str__(self):
         return self.error_number
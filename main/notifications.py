@@ -0,0 +1,270 @@
+import atexit
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from . import models as main_models
+
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+
+
+class RetryAfter(Exception):
+    def __init__(self, seconds, message=''):
+        super().__init__(message or f'Retry after {seconds} seconds')
+        self.seconds = seconds
+
+
+class TelegramTransport:
+    def __init__(self):
+        if not settings.TELEGRAM_BOT_TOKEN:
+            raise ImproperlyConfigured('TELEGRAM_BOT_TOKEN is not set')
+        import telebot
+        self.bot = telebot.TeleBot(settings.TELEGRAM_BOT_TOKEN)
+
+    def send(self, chat_id, text):
+        from telebot.apihelper import ApiTelegramException
+        try:
+            self.bot.send_message(chat_id, text)
+        except ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                raise RetryAfter(retry_after, str(e))
+            raise
+
+
+class LocalTransport:
+    outbox = []
+
+    def send(self, chat_id, text):
+        self.outbox.append((chat_id, text))
+
+
+class RateLimiter:
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.rate = rate / per
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            time.sleep((1 - self.tokens) / self.rate)
+
+
+def format_result(profile, result, question_count):
+    return f'''Lid:
+Ismi: {profile.name}
+Telefoni: {profile.phone_number}
+Togri javoblar: {result.score}
+Umumiy savolar soni: {question_count}
+'''
+
+
+def queued_queryset(results):
+    return (main_models.NotificationOutbox.objects.filter(result__in=[result.id for result in results])
+            .values_list('result_id', 'attempt'))
+
+
+def build_entries(profile, results, queued):
+    # Results are usually viewed more than once per attempt; only insert what is not queued yet,
+    # so a plain results view stays a read (and can keep reading from a replica).
+    chat_id = settings.TELEGRAM_CHAT_ID
+    return [
+        main_models.NotificationOutbox(
+            profile=profile,
+            result=result,
+            attempt=result.attempt,
+            chat_id=chat_id,
+            text=format_result(profile, result, result.test.served_question_count),
+        )
+        for result in results if (result.id, result.attempt) not in queued
+    ]
+
+
+def wake_worker():
+    if getattr(settings, 'NOTIFICATION_WORKER_AUTOSTART', True):
+        worker = get_worker()
+        if worker is not None:
+            worker.wake()
+
+
+def enqueue_results(profile, results):
+    entries = build_entries(profile, results, set(queued_queryset(results)))
+    if entries:
+        main_models.NotificationOutbox.objects.bulk_create(entries, ignore_conflicts=True)
+        wake_worker()
+
+
+async def aenqueue_results(profile, results):
+    entries = build_entries(profile, results, {entry async for entry in queued_queryset(results)})
+    if entries:
+        await main_models.NotificationOutbox.objects.abulk_create(entries, ignore_conflicts=True)
+        wake_worker()
+
+
+def pack_entries(entries):
+    groups = []
+    current = []
+    length = 0
+    for entry in entries:
+        size = min(len(entry.text), MAX_MESSAGE_LENGTH)
+        if current and length + size + 1 > MAX_MESSAGE_LENGTH:
+            groups.append(current)
+            current = []
+            length = 0
+        length += size + (1 if current else 0)
+        current.append(entry)
+    if current:
+        groups.append(current)
+    return groups
+
+
+class OutboxWorker:
+    def __init__(self, transport, batch_size=20, max_tries=8, backoff=2, max_backoff=3600,
+                 lease=60, interval=5, global_rate=30, chat_rate=20):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self.interval = interval
+        self.global_limiter = RateLimiter(global_rate, 1)
+        self.chat_rate = chat_rate
+        self.chat_limiters = {}
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.metrics = {'sent': 0, 'messages': 0, 'retried': 0, 'failed': 0}
+
+    def claim(self):
+        now = timezone.now()
+        due = Q(status=main_models.NotificationOutbox.STATUS_PENDING) | Q(status=main_models.NotificationOutbox.STATUS_SENDING)
+        ids = list(main_models.NotificationOutbox.objects.filter(due, next_attempt_at__lte=now)
+                   .order_by('next_attempt_at', 'id').values_list('id', flat=True)[:self.batch_size])
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        main_models.NotificationOutbox.objects.filter(due, id__in=ids, next_attempt_at__lte=now).update(
+            status=main_models.NotificationOutbox.STATUS_SENDING,
+            claim=token,
+            next_attempt_at=now + timedelta(seconds=self.lease),
+        )
+        return list(main_models.NotificationOutbox.objects.filter(claim=token).order_by('id'))
+
+    def backoff_for(self, tries):
+        return min(self.max_backoff, self.backoff * 2 ** tries)
+
+    def reschedule(self, entries, error, delay=None):
+        now = timezone.now()
+        by_tries = {}
+        for entry in entries:
+            by_tries.setdefault(entry.tries, []).append(entry.id)
+        for tries, ids in by_tries.items():
+            queryset = main_models.NotificationOutbox.objects.filter(id__in=ids)
+            if delay is None and tries + 1 >= self.max_tries:
+                queryset.update(status=main_models.NotificationOutbox.STATUS_FAILED, tries=tries + 1,
+                                last_error=error, claim='')
+                self.metrics['failed'] += len(ids)
+                continue
+            queryset.update(
+                status=main_models.NotificationOutbox.STATUS_PENDING, tries=tries + 1, last_error=error, claim='',
+                next_attempt_at=now + timedelta(seconds=self.backoff_for(tries) if delay is None else delay),
+            )
+            self.metrics['retried'] += len(ids)
+
+    def send_chat(self, chat_id, entries):
+        limiter = self.chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = self.chat_limiters[chat_id] = RateLimiter(self.chat_rate, 60)
+        groups = pack_entries(entries)
+        for position, group in enumerate(groups):
+            message = '\n'.join(entry.text[:MAX_MESSAGE_LENGTH] for entry in group)
+            self.global_limiter.acquire()
+            limiter.acquire()
+            try:
+                self.transport.send(chat_id, message)
+            except RetryAfter as e:
+                self.reschedule([entry for rest in groups[position:] for entry in rest], str(e), delay=e.seconds)
+                return
+            except Exception as e:
+                logger.warning('Could not send notification to %s: %s', chat_id, e)
+                self.reschedule(group, str(e))
+            else:
+                main_models.NotificationOutbox.objects.filter(id__in=[entry.id for entry in group]).update(
+                    status=main_models.NotificationOutbox.STATUS_SENT, sent_at=timezone.now(), claim='',
+                )
+                self.metrics['sent'] += len(group)
+                self.metrics['messages'] += 1
+
+    def drain(self):
+        sent = 0
+        while True:
+            entries = self.claim()
+            if not entries:
+                return sent
+            by_chat = {}
+            for entry in entries:
+                by_chat.setdefault(entry.chat_id, []).append(entry)
+            for chat_id, chat_entries in by_chat.items():
+                self.send_chat(chat_id, chat_entries)
+            sent += len(entries)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Notification outbox drain failed')
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='notification-outbox', daemon=True)
+                self.thread.start()
+                atexit.register(self.drain)
+
+    def wake(self):
+        self.start()
+        self.wakeup.set()
+
+
+_worker = None
+_worker_built = False
+_worker_lock = threading.Lock()
+
+
+def build_worker():
+    # Without a configured transport entries stay pending in the outbox until one is set up.
+    try:
+        transport = import_string(getattr(settings, 'NOTIFICATION_TRANSPORT', 'main.notifications.TelegramTransport'))()
+    except ImproperlyConfigured as e:
+        logger.warning('Result notifications are not sent: %s', e)
+        return None
+    return OutboxWorker(transport, **getattr(settings, 'NOTIFICATION_OUTBOX', {}))
+
+
+def get_worker():
+    global _worker, _worker_built
+    with _worker_lock:
+        if not _worker_built:
+            _worker = build_worker()
+            _worker_built = True
+        return _worker
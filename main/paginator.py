@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def get_config():
+    config = {
+        'exact_below': 10000,
+        'max_count': 100000,
+    }
+    config.update(getattr(settings, 'ADMIN_PAGINATOR', {}))
+    return config
+
+
+def estimate_count(queryset):
+    # Only an unfiltered table can be estimated from statistics.
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.group_by:
+        return None
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+            if row and row[0] > 0:
+                return row[0]
+        elif connection.vendor == 'sqlite':
+            try:
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+            except DatabaseError:
+                row = None
+            if row:
+                return int(row[0].split()[0])
+    # sqlite_stat1 only exists after ANALYZE. Without statistics the table is counted like a
+    # filtered one; an id range is no estimate for tables that are pruned, like ErrorLog.
+    return None
+
+
+def capped_count(queryset):
+    return queryset.order_by().values('pk')[:get_config()['max_count']].count()
+
+
+class CappedCountPaginator(Paginator):
+    # Counts up to max_count rows, so later pages of a larger result are not linked.
+
+    @cached_property
+    def count(self):
+        return capped_count(self.object_list)
+
+
+class EstimatedCountPaginator(Paginator):
+    # Small result sets are counted exactly. An unfiltered large table uses the database's
+    # statistics when it has them, and anything else is counted up to max_count.
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= get_config()['exact_below']:
+            return estimate
+        return capped_count(self.object_list)
@@ -0,0 +1,52 @@
+import random
+import time
+from django.conf import settings
+from django.db import connections
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.aliases = {}
+        self.shapes = {}
+
+    def wrapper_for(self, alias):
+        def wrapper(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats = self.aliases.setdefault(alias, [0, 0.0])
+                stats[0] += 1
+                stats[1] += time.perf_counter() - started
+                key = (alias, sql)
+                self.shapes[key] = self.shapes.get(key, 0) + 1
+        return wrapper
+
+    def install(self, stack):
+        for alias in settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(self.wrapper_for(alias)))
+
+    @property
+    def count(self):
+        return sum(stats[0] for stats in self.aliases.values())
+
+    @property
+    def duration(self):
+        return sum(stats[1] for stats in self.aliases.values())
+
+    def repeated(self, threshold):
+        return {key: count for key, count in self.shapes.items() if count >= threshold}
+
+
+def get_config():
+    config = {
+        'sample_rate': 1.0 if settings.DEBUG else 0.01,
+        'repeat_threshold': 2,
+        'headers': settings.DEBUG,
+    }
+    config.update(getattr(settings, 'QUERY_ACCOUNTING', {}))
+    return config
+
+
+def should_sample(rate):
+    return rate >= 1 or random.random() < rate
@@ -0,0 +1,173 @@
+import csv
+import io
+import json
+import time
+from django.db import transaction
+from . import models as main_models
+from . import cache as main_cache
+
+
+FORMATS = ('jsonl', 'csv')
+CSV_KEY = 'question_id'
+CSV_FIELDS = ('question', 'answer', 'is_correct')
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+
+
+class QuestionBankError(ValueError):
+    pass
+
+
+def guess_format(path, default='jsonl'):
+    if path and path.lower().endswith('.csv'):
+        return 'csv'
+    if path and path.lower().endswith(('.jsonl', '.ndjson', '.json')):
+        return 'jsonl'
+    return default
+
+
+def parse_jsonl(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            text = record['text']
+            answers = [(answer['text'], bool(answer.get('is_correct', False))) for answer in record.get('answers', [])]
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise QuestionBankError(f'Line {number}: {e!r}')
+        if not isinstance(text, str) or not text.strip():
+            raise QuestionBankError(f'Line {number}: question text is empty')
+        yield text, answers
+
+
+def parse_csv(lines):
+    # One row per answer. Rows sharing a question_id are one question; without that column,
+    # questions are separated by blank lines. Repeated question text alone never merges questions.
+    reader = csv.reader(lines)
+    header = next(reader, None) or []
+    missing = set(CSV_FIELDS) - set(header)
+    if missing:
+        raise QuestionBankError(f'CSV header is missing {", ".join(sorted(missing))}')
+    has_key = CSV_KEY in header
+    key, text, answers = None, None, []
+    seen = set()
+    for row in reader:
+        if not any(value.strip() for value in row):
+            if not has_key and text is not None:
+                yield text, answers
+                text, answers = None, []
+            continue
+        row = dict(zip(header, row))
+        question = row.get('question') or ''
+        if not question.strip():
+            raise QuestionBankError(f'Line {reader.line_num}: question text is empty')
+        row_key = (row.get(CSV_KEY) or '').strip() if has_key else None
+        if has_key and not row_key:
+            raise QuestionBankError(f'Line {reader.line_num}: {CSV_KEY} is empty')
+        if text is not None and has_key and row_key != key:
+            yield text, answers
+            text, answers = None, []
+        if text is None:
+            if row_key in seen:
+                raise QuestionBankError(f'Line {reader.line_num}: {CSV_KEY} {row_key} was already used')
+            if has_key:
+                seen.add(row_key)
+            key, text = row_key, question
+        elif question != text:
+            raise QuestionBankError(f'Line {reader.line_num}: question text differs from the rows above it')
+        if row.get('answer'):
+            answers.append((row['answer'], (row.get('is_correct') or '').strip().lower() in TRUE_VALUES))
+    if text is not None:
+        yield text, answers
+
+
+def parse(lines, fmt):
+    if fmt == 'csv':
+        return parse_csv(lines)
+    return parse_jsonl(lines)
+
+
+def chunked(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_questions(records, test_ids=(), chunk_size=1000, progress=None):
+    Through = main_models.Test.questions.through
+    started = time.monotonic()
+    questions = answers = 0
+    try:
+        for chunk in chunked(records, chunk_size):
+            with transaction.atomic():
+                created = main_models.Question.objects.bulk_create(
+                    [main_models.Question(text=text) for text, _ in chunk], batch_size=chunk_size)
+                new_answers = main_models.Answer.objects.bulk_create(
+                    [main_models.Answer(question_id=question.id, text=text, is_correct=is_correct)
+                     for question, (_, rows) in zip(created, chunk) for text, is_correct in rows],
+                    batch_size=chunk_size)
+                Through.objects.bulk_create(
+                    [Through(test_id=test_id, question_id=question.id) for test_id in test_ids for question in created],
+                    batch_size=chunk_size)
+            questions += len(created)
+            answers += len(new_answers)
+            if progress is not None:
+                progress(questions, answers, time.monotonic() - started)
+    except QuestionBankError as e:
+        if questions:
+            raise QuestionBankError(f'{e} ({questions} questions before this line were imported)') from e
+        raise
+    finally:
+        # bulk_create bypasses the signals that keep these in sync.
+        if questions:
+            if test_ids:
+                main_models.Test.refresh_question_counts(test_ids)
+            main_cache.invalidate()
+    return questions, answers
+
+
+def iter_questions(queryset, chunk_size=1000):
+    for question in queryset.order_by('id').prefetch_related('answers').iterator(chunk_size=chunk_size):
+        yield question.text, [(answer.text, answer.is_correct)
+                              for answer in sorted(question.answers.all(), key=lambda answer: answer.id)]
+
+
+def render_jsonl(records):
+    for text, answers in records:
+        yield json.dumps({'text': text, 'answers': [{'text': answer, 'is_correct': is_correct}
+                                                    for answer, is_correct in answers]}, ensure_ascii=False) + '\n'
+
+
+def render_csv(records):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow((CSV_KEY,) + CSV_FIELDS)
+    yield flush()
+    for number, (text, answers) in enumerate(records, 1):
+        for answer, is_correct in answers or [('', False)]:
+            writer.writerow((number, text, answer, int(is_correct)))
+        yield flush()
+
+
+def render(records, fmt):
+    if fmt == 'csv':
+        return render_csv(records)
+    return render_jsonl(records)
+
+
+def export_questions(queryset=None, fmt='jsonl', chunk_size=1000):
+    if queryset is None:
+        queryset = main_models.Question.objects.all()
+    return render(iter_questions(queryset, chunk_size), fmt)
@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+
+
+class LocalStore:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def update(self, key, func, expire):
+        with self.lock:
+            state = func(self.buckets.pop(key, None))
+            self.buckets[key] = state
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+            return state
+
+
+class MemcacheStore:
+    def __init__(self, client, max_retries=10):
+        self.client = client
+        self.max_retries = max_retries
+
+    @staticmethod
+    def dump(state):
+        return f'{state[0]:.6f}:{state[1]:.6f}'
+
+    @staticmethod
+    def load(value):
+        if isinstance(value, bytes):
+            value = value.decode()
+        tokens, updated = value.split(':')
+        return float(tokens), float(updated)
+
+    def update(self, key, func, expire):
+        for _ in range(self.max_retries):
+            value, cas = self.client.gets(key)
+            if value is None:
+                state = func(None)
+                if self.client.add(key, self.dump(state), expire=expire, noreply=False):
+                    return state
+                continue
+            state = func(self.load(value))
+            if self.client.cas(key, self.dump(state), cas, expire=expire, noreply=False):
+                return state
+        # Under heavy contention fall back to the last computed state rather than blocking the request.
+        return state
+
+
+class TokenBucketLimiter:
+    def __init__(self, store, default, routes=None, clock=time.time):
+        # Routes starting with '/' match by path prefix, the longest first. Anything else is a URL
+        # name, or a tuple of names sharing one bucket, and takes precedence over the prefixes.
+        self.store = store
+        self.default = default
+        self.names = {}
+        prefixes = []
+        for route, limit in (routes or {}).items():
+            if isinstance(route, str) and route.startswith('/'):
+                prefixes.append((route, limit))
+                continue
+            names = (route,) if isinstance(route, str) else tuple(route)
+            for name in names:
+                self.names[name] = (','.join(names), limit)
+        self.routes = sorted(prefixes, key=lambda item: len(item[0]), reverse=True)
+        self.clock = clock
+
+    def limit_for(self, path, url_name=None):
+        if url_name in self.names:
+            return self.names[url_name]
+        for prefix, limit in self.routes:
+            if path.startswith(prefix):
+                return prefix, limit
+        return '*', self.default
+
+    def consume(self, key, capacity, period):
+        rate = capacity / period
+        now = self.clock()
+        result = {}
+
+        def refill(state):
+            tokens, updated = state if state is not None else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            result['allowed'] = tokens >= 1
+            if result['allowed']:
+                tokens -= 1
+            result['tokens'] = tokens
+            return tokens, now
+
+        self.store.update(key, refill, expire=int(math.ceil(period)) + 1)
+        retry_after = 0 if result['allowed'] else int(math.ceil((1 - result['tokens']) / rate))
+        return result['allowed'], result['tokens'], retry_after
+
+    def check(self, ip, path, url_name=None):
+        route, (capacity, period) = self.limit_for(path, url_name)
+        allowed, tokens, retry_after = self.consume(f'rl:{route}:{ip}', capacity, period)
+        return allowed, capacity, int(tokens), retry_after
+
+
+def build_store(config):
+    if config.get('store') == 'memcache':
+        from pymemcache.client.base import PooledClient
+        return MemcacheStore(PooledClient(config.get('location', '127.0.0.1:11211'), timeout=0.2,
+                                          connect_timeout=0.2))
+    return LocalStore(config.get('max_entries', 10000))
+
+
+def build_limiter(default=None):
+    config = getattr(settings, 'RATE_LIMIT', {})
+    return TokenBucketLimiter(
+        build_store(config),
+        default=tuple(config.get('default', default or (100, 60))),
+        routes={route: tuple(limit) for route, limit in config.get('routes', {}).items()},
+    )
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from rest_framework.authtoken.models import Token
+from . import models as main_models
+from . import cache as main_cache
+from . import scoring as main_scoring
+from . import database as main_database
+
+
+class RegistrationError(ValueError):
+    pass
+
+
+def find_profile(name, normalized_phone):
+    return (main_models.Profile.objects.select_related('user__auth_token')
+            .filter(normalized_phone=normalized_phone, name=name).first())
+
+
+def get_token_key(user):
+    try:
+        return user.auth_token.key
+    except Token.DoesNotExist:
+        return Token.objects.get_or_create(user=user)[0].key
+
+
+def create_account(name, phone_number, normalized_phone):
+    with transaction.atomic():
+        user = main_models.User(username=f'{normalized_phone}-{name}'[:150])
+        if getattr(settings, 'REGISTRATION_SET_PASSWORD', False):
+            user.set_password(phone_number)
+        else:
+            user.set_unusable_password()
+        user.save()
+        profile = main_models.Profile.objects.create(user=user, name=name, phone_number=phone_number)
+        test_id = main_cache.get_default_test_id()
+        if test_id is not None:
+            main_models.UserTestResult.objects.create(user=profile, test_id=test_id, score=0)
+        return Token.objects.create(user=user).key
+
+
+def register(name, phone_number):
+    name = str(name)
+    normalized_phone = main_models.Profile.normalize_phone(phone_number)
+    if not name.strip() or not normalized_phone:
+        raise RegistrationError('Name or phone number is invalid.')
+
+    profile = find_profile(name, normalized_phone)
+    if profile is None:
+        try:
+            token_key = create_account(name, phone_number, normalized_phone)
+            # The client's next request comes with this token; keep it on the primary.
+            main_database.identify(token_key)
+            return token_key, True
+        except IntegrityError:
+            # Another request registered the same identity between the lookup and the insert.
+            profile = find_profile(name, normalized_phone)
+            if profile is None:
+                raise
+
+    main_scoring.reset(profile.id)
+    token_key = get_token_key(profile.user)
+    main_database.identify(token_key)
+    return token_key, False
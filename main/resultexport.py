@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import models as main_models
+
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ('id', 'user_id', 'user__name', 'user__phone_number', 'test_id', 'test__title', 'score', 'attempt',
+          'date_taken')
+HEADERS = ('id', 'profile_id', 'name', 'phone_number', 'test_id', 'test_title', 'score', 'attempt', 'date_taken')
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_day(value, name):
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ExportError(f'{name} must be a date in YYYY-MM-DD format')
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_results(queryset=None, test_id=None, date_from=None, date_to=None):
+    if queryset is None:
+        queryset = main_models.UserTestResult.objects.all()
+    if test_id:
+        try:
+            queryset = queryset.filter(test_id=int(test_id))
+        except ValueError:
+            raise ExportError('test must be a test id')
+    start = parse_day(date_from, 'from')
+    if start is not None:
+        queryset = queryset.filter(date_taken__gte=start)
+    end = parse_day(date_to, 'to')
+    if end is not None:
+        queryset = queryset.filter(date_taken__lt=end + timedelta(days=1))
+    return queryset
+
+
+def iter_rows(queryset, chunk_size=2000):
+    return queryset.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+
+
+def render_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(HEADERS)
+    for count, row in enumerate(rows, 1):
+        writer.writerow(row[:-1] + (row[-1].isoformat(),))
+        if count % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def render_jsonl(rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(HEADERS, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        if len(lines) >= 500:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines)
+
+
+def export_results(queryset, fmt='csv', chunk_size=2000):
+    rows = iter_rows(queryset, chunk_size)
+    if fmt == 'jsonl':
+        return render_jsonl(rows)
+    return render_csv(rows)
+
+
+def response(queryset, fmt='csv', filename='results'):
+    streaming = StreamingHttpResponse(export_results(queryset, fmt),
+                                      content_type='application/x-ndjson' if fmt == 'jsonl' else 'text/csv')
+    streaming['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return streaming
@@ -0,0 +1,171 @@
+import copy
+import os
+import re
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from . import models as main_models
+from .database import ERROR_MODELS
+
+
+ARCHIVE_ALIAS_PATTERN = re.compile(r'errors_(\d{4})_(\d{2})')
+ARCHIVE_FILE_PATTERN = re.compile(r'errors-(\d{4})-(\d{2})\.sqlite3')
+
+
+def get_config():
+    config = {
+        'days': 30,
+        'batch_size': 1000,
+        'pause': 0.05,
+        'rotate': False,
+        'archive_dir': os.path.join(settings.BASE_DIR, 'errors_archive'),
+        'vacuum_pages': 2000,
+    }
+    config.update(getattr(settings, 'ERROR_RETENTION', {}))
+    return config
+
+
+def get_targets():
+    # (model, timestamp field) pairs that expire; groups go once nothing has been seen for them.
+    return [
+        (main_models.ErrorLog, 'created_at'),
+        (main_models.ErrorGroup, 'last_seen'),
+    ]
+
+
+class ErrorArchiveRouter:
+    # Monthly archive databases only hold the error tables.
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if ARCHIVE_ALIAS_PATTERN.fullmatch(db):
+            return f'{app_label}.{model_name}' in ERROR_MODELS
+        return None
+
+
+def archive_alias(month):
+    return f'errors_{month:%Y_%m}'
+
+
+def register_archive(path, alias):
+    if alias not in connections.settings:
+        database = copy.deepcopy(connections.settings['errors_db'])
+        database['NAME'] = path
+        connections.settings[alias] = database
+    return alias
+
+
+def register_archives(config=None):
+    config = config or get_config()
+    aliases = []
+    if not os.path.isdir(config['archive_dir']):
+        return aliases
+    for name in sorted(os.listdir(config['archive_dir'])):
+        match = ARCHIVE_FILE_PATTERN.fullmatch(name)
+        if match:
+            alias = 'errors_{}_{}'.format(*match.groups())
+            aliases.append(register_archive(os.path.join(config['archive_dir'], name), alias))
+    return aliases
+
+
+def open_archive(month, config):
+    alias = archive_alias(month)
+    path = os.path.join(config['archive_dir'], f'errors-{month:%Y-%m}.sqlite3')
+    if alias in connections.settings:
+        return alias
+    os.makedirs(config['archive_dir'], exist_ok=True)
+    register_archive(path, alias)
+    with connections[alias].cursor() as cursor:
+        # Set before any table exists, so the archive never needs a full VACUUM to switch modes.
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    call_command('migrate', 'main', database=alias, verbosity=0, interactive=False)
+    return alias
+
+
+def expired(model, field, cutoff, using='errors_db'):
+    return model._default_manager.using(using).filter(**{f'{field}__lt': cutoff})
+
+
+def preview(cutoff, using='errors_db'):
+    report = []
+    for model, field in get_targets():
+        months = (expired(model, field, cutoff, using).annotate(month=TruncMonth(field)).values('month')
+                  .annotate(rows=Count('id')).order_by('month'))
+        report.append((model, [(row['month'], row['rows']) for row in months]))
+    return report
+
+
+def archive_rows(model, field, objects, config):
+    by_month = {}
+    for obj in objects:
+        month = timezone.localtime(getattr(obj, field)).date().replace(day=1)
+        by_month.setdefault(month, []).append(obj)
+    for month, rows in by_month.items():
+        alias = open_archive(month, config)
+        model._default_manager.using(alias).bulk_create(rows, batch_size=config['batch_size'], ignore_conflicts=True)
+
+
+def prune(model, field, cutoff, config, using='errors_db', progress=None):
+    # Each batch is its own short transaction and the loop sleeps between batches, so the
+    # error writer and the admin never wait on one long DELETE. Archived rows are written
+    # before they are deleted; a rerun after a crash skips ids already in the archive.
+    deleted = batches = 0
+    started = time.monotonic()
+    while True:
+        queryset = expired(model, field, cutoff, using).order_by(field, 'id')[:config['batch_size']]
+        if config['rotate']:
+            objects = list(queryset)
+            ids = [obj.id for obj in objects]
+        else:
+            ids = list(queryset.values_list('id', flat=True))
+        if not ids:
+            break
+        if config['rotate']:
+            archive_rows(model, field, objects, config)
+        with transaction.atomic(using=using):
+            deleted += model._default_manager.using(using).filter(id__in=ids).delete()[0]
+        batches += 1
+        if progress is not None:
+            progress(model, deleted, time.monotonic() - started)
+        if len(ids) < config['batch_size']:
+            break
+        time.sleep(config['pause'])
+    return {'deleted': deleted, 'batches': batches, 'seconds': time.monotonic() - started}
+
+
+def get_pragma(using, name):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'PRAGMA {name}')
+        return cursor.fetchone()[0]
+
+
+def compact(using='errors_db', pages=2000, convert=False):
+    # auto_vacuum=INCREMENTAL lets free pages be returned a few at a time. Switching an existing
+    # database to it needs one full VACUUM, which rewrites the file, so it only runs with convert.
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return None
+    before = get_pragma(using, 'freelist_count')
+    mode = get_pragma(using, 'auto_vacuum')
+    with connection.cursor() as cursor:
+        if mode != 2 and convert:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM')
+            mode = 2
+        elif mode == 2:
+            cursor.execute(f'PRAGMA incremental_vacuum({int(pages)})')
+            cursor.fetchall()
+    return {
+        'mode': {0: 'none', 1: 'full', 2: 'incremental'}[mode],
+        'free_pages_before': before,
+        'free_pages_after': get_pragma(using, 'freelist_count'),
+        'page_size': get_pragma(using, 'page_size'),
+    }
+
+
+def get_cutoff(days):
+    return timezone.now() - timedelta(days=days)
@@ -0,0 +1,207 @@
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Case, When, Value
+from . import models as main_models
+from . import leaderboard as main_leaderboard
+from . import stats as main_stats
+
+
+logger = logging.getLogger(__name__)
+
+KEY_CHUNK_SIZE = 200
+
+
+def match_keys(keys):
+    # Match the exact (profile, test) pairs; user_id__in/test_id__in would also match their cross product.
+    condition = Q()
+    for profile_id, test_id in keys:
+        condition |= Q(user_id=profile_id, test_id=test_id)
+    return condition
+
+
+def missing_after_update(increments, keys):
+    existing = set()
+    # Chunked so the OR of key pairs stays well inside SQLite's expression depth limit.
+    for start in range(0, len(keys), KEY_CHUNK_SIZE):
+        chunk = keys[start:start + KEY_CHUNK_SIZE]
+        increment_expression = Case(
+            *[When(user_id=profile_id, test_id=test_id, then=Value(increments[profile_id, test_id]))
+              for profile_id, test_id in chunk],
+            default=Value(0),
+        )
+        condition = match_keys(chunk)
+        main_models.UserTestResult.objects.filter(condition).update(score=F('score') + increment_expression)
+        existing.update(main_models.UserTestResult.objects.filter(condition).values_list('user_id', 'test_id'))
+    return [key for key in keys if key not in existing]
+
+
+def apply_increments(increments):
+    increments = {key: delta for key, delta in increments.items() if delta}
+    if not increments:
+        return
+    keys = list(increments)
+    with transaction.atomic():
+        if len(keys) == 1:
+            # A single answer is the common case: the UPDATE's rowcount says whether the row exists.
+            (profile_id, test_id), delta = next(iter(increments.items()))
+            updated = main_models.UserTestResult.objects.filter(user_id=profile_id, test_id=test_id).update(
+                score=F('score') + delta)
+            missing = [] if updated else keys
+        else:
+            missing = missing_after_update(increments, keys)
+        # The unique (user, test) constraint keeps a concurrent first answer from creating a second row.
+        if missing:
+            main_models.UserTestResult.objects.bulk_create([
+                main_models.UserTestResult(user_id=profile_id, test_id=test_id, score=increments[profile_id, test_id])
+                for profile_id, test_id in missing
+            ])
+        main_stats.apply_increments(increments, missing)
+        transaction.on_commit(lambda: main_leaderboard.record_increments(increments))
+
+
+class ScoreBuffer:
+    def __init__(self, interval, threshold):
+        self.interval = interval
+        self.threshold = threshold
+        self.pending = {}
+        self.in_flight = {}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, key, delta=1):
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + delta
+            self.size += 1
+            full = self.size >= self.threshold
+        self.start()
+        if full:
+            self.wakeup.set()
+
+    def discard(self, profile_id, test_id=None):
+        with self.lock:
+            for key in [key for key in self.pending if key[0] == profile_id and test_id in (None, key[1])]:
+                del self.pending[key]
+
+    def buffered(self, key):
+        with self.lock:
+            return self.pending.get(key, 0) + self.in_flight.get(key, 0)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending:
+                    return 0
+                self.in_flight, self.pending = self.pending, {}
+                self.size = 0
+            batch = self.in_flight
+            try:
+                apply_increments(batch)
+            except Exception:
+                logger.exception('Could not flush %d buffered score increments', len(batch))
+                with self.lock:
+                    for key, delta in batch.items():
+                        self.pending[key] = self.pending.get(key, 0) + delta
+                        self.size += 1
+                return 0
+            finally:
+                with self.lock:
+                    self.in_flight = {}
+            return len(batch)
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, name='score-flusher', daemon=True)
+            self.thread.start()
+        atexit.register(self.flush)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def write_behind_enabled():
+    return getattr(settings, 'SCORE_WRITE_BEHIND', False)
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ScoreBuffer(
+                interval=getattr(settings, 'SCORE_FLUSH_INTERVAL_MS', 200) / 1000,
+                threshold=getattr(settings, 'SCORE_FLUSH_THRESHOLD', 100),
+            )
+        return _buffer
+
+
+def increment(profile_id, test_id, delta=1):
+    if write_behind_enabled():
+        get_buffer().add((profile_id, test_id), delta)
+    else:
+        apply_increments({(profile_id, test_id): delta})
+
+
+async def aincrement(profile_id, test_id, delta=1):
+    if write_behind_enabled():
+        get_buffer().add((profile_id, test_id), delta)
+    else:
+        await sync_to_async(apply_increments)({(profile_id, test_id): delta})
+
+
+def buffered(profile_id, test_id):
+    if _buffer is None:
+        return 0
+    return _buffer.buffered((profile_id, test_id))
+
+
+@contextmanager
+def discarding(profile_id, test_id=None):
+    # Holding flush_lock waits out a flush that already took these increments in flight, so
+    # they cannot land after the reset; whatever is still pending is dropped.
+    if _buffer is None:
+        yield
+        return
+    with _buffer.flush_lock:
+        _buffer.discard(profile_id, test_id)
+        yield
+
+
+def reset(profile_id):
+    with discarding(profile_id), transaction.atomic():
+        main_models.UserTestResult.objects.filter(user_id=profile_id).update(score=0, attempt=F('attempt') + 1)
+        main_stats.reset(profile_id)
+        transaction.on_commit(lambda: main_leaderboard.record_reset(profile_id))
+
+
+def set_score(profile_id, test_id, score):
+    with discarding(profile_id, test_id), transaction.atomic():
+        updated = main_models.UserTestResult.objects.filter(user_id=profile_id, test_id=test_id).update(score=score)
+        if updated:
+            main_stats.refresh([profile_id])
+        else:
+            main_models.UserTestResult.objects.create(user_id=profile_id, test_id=test_id, score=score)
+        transaction.on_commit(lambda: main_leaderboard.record(test_id, profile_id, score))
+
+
+def flush():
+    if _buffer is not None:
+        return _buffer.flush()
+    return 0
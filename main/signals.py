@@ -0,0 +1,86 @@
+import threading
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from . import models as main_models
+from . import cache as main_cache
+from . import leaderboard as main_leaderboard
+from . import stats as main_stats
+from . import authentication as main_authentication
+
+
+@receiver(post_save, sender=main_models.Question)
+@receiver(post_save, sender=main_models.Answer)
+@receiver(post_delete, sender=main_models.Answer)
+@receiver(post_save, sender=main_models.Test)
+@receiver(post_delete, sender=main_models.Test)
+def invalidate_question_cache(sender, **kwargs):
+    main_cache.invalidate()
+
+
+_pending = threading.local()
+
+
+def refresh_all_question_counts():
+    _pending.transaction = None
+    main_models.Test.refresh_question_counts()
+    main_cache.invalidate()
+
+
+@receiver(post_delete, sender=main_models.Question)
+def update_question_counts_on_delete(sender, using, **kwargs):
+    # Deleting many questions sends one signal per row; recount once per transaction.
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        refresh_all_question_counts()
+        return
+    outermost = connection.atomic_blocks[0]
+    if getattr(_pending, 'transaction', None) is outermost:
+        return
+    _pending.transaction = outermost
+    transaction.on_commit(refresh_all_question_counts, using=using)
+
+
+@receiver(m2m_changed, sender=main_models.Test.questions.through)
+def invalidate_question_cache_on_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            main_models.Test.refresh_question_counts([instance.pk])
+        elif pk_set:
+            main_models.Test.refresh_question_counts(pk_set)
+        else:
+            main_models.Test.refresh_question_counts()
+        main_cache.invalidate()
+
+
+@receiver(post_save, sender=main_models.UserTestResult)
+def update_leaderboard(sender, instance, **kwargs):
+    main_leaderboard.record(instance.test_id, instance.user_id, instance.score)
+    main_stats.refresh([instance.user_id])
+
+
+@receiver(post_delete, sender=main_models.UserTestResult)
+def remove_from_leaderboard(sender, instance, **kwargs):
+    main_leaderboard.forget(instance.test_id, instance.user_id)
+    # The profile itself may be going away in the same cascade, so recount once it has committed.
+    transaction.on_commit(lambda: main_stats.refresh(
+        main_models.Profile.objects.filter(id=instance.user_id).values_list('id', flat=True)))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    main_authentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=main_models.User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    if not created:
+        main_authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=main_models.Profile)
+@receiver(post_delete, sender=main_models.Profile)
+def invalidate_profile_tokens(sender, instance, created=False, **kwargs):
+    if not created:
+        main_authentication.invalidate_user(instance.user_id)
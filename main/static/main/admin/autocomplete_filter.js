@@ -0,0 +1,14 @@
+'use strict';
+{
+    const $ = django.jQuery;
+    $(document).on('change', 'select.autocomplete-filter', function() {
+        const params = new URLSearchParams(window.location.search);
+        if (this.value) {
+            params.set(this.dataset.filterParam, this.value);
+        } else {
+            params.delete(this.dataset.filterParam);
+        }
+        params.delete('p');
+        window.location.search = params.toString();
+    });
+}
@@ -0,0 +1,52 @@
+from asgiref.sync import sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AsyncStaticFiles:
+    # WhiteNoiseMiddleware is sync-only, so inside an async middleware chain it would push every
+    # request through a thread. This serves WhiteNoise's file index in front of the Django ASGI
+    # application instead and passes everything else through untouched.
+
+    def __init__(self, application):
+        self.application = application
+        self.whitenoise = WhiteNoiseMiddleware(get_response=None)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith(self.whitenoise.static_prefix):
+            static_file = await self.find(scope['path'])
+            if static_file is not None:
+                await self.serve(static_file, scope, send)
+                return
+        await self.application(scope, receive, send)
+
+    async def find(self, path):
+        if self.whitenoise.autorefresh:
+            return await sync_to_async(self.whitenoise.find_file, thread_sensitive=False)(path)
+        return self.whitenoise.files.get(path)
+
+    async def serve(self, static_file, scope, send):
+        # WhiteNoise reads the request headers in their WSGI form.
+        request_headers = {'HTTP_' + name.decode('latin1').upper().replace('-', '_'): value.decode('latin1')
+                           for name, value in scope['headers']}
+        response = await sync_to_async(static_file.get_response, thread_sensitive=False)(
+            scope['method'], request_headers)
+        await send({
+            'type': 'http.response.start',
+            'status': int(response.status),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers],
+        })
+        if response.file is None:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+        read = sync_to_async(response.file.read, thread_sensitive=False)
+        try:
+            while True:
+                chunk = await read(CHUNK_SIZE)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': bool(chunk)})
+                if not chunk:
+                    break
+        finally:
+            response.file.close()
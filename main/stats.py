@@ -0,0 +1,94 @@
+from django.db import transaction
+from django.db.models import F, Case, When, Value, Count, Sum
+from . import models as main_models
+
+
+def compute(profile_ids=None):
+    queryset = main_models.UserTestResult.objects.order_by()
+    if profile_ids is not None:
+        queryset = queryset.filter(user_id__in=profile_ids)
+    return {row['user_id']: (row['tests'], row['total'] or 0)
+            for row in queryset.values('user_id').annotate(tests=Count('id'), total=Sum('score'))}
+
+
+def store(stats, batch_size=500):
+    main_models.ProfileStats.objects.bulk_create(
+        [main_models.ProfileStats(profile_id=profile_id, tests_taken=tests, total_score=total)
+         for profile_id, (tests, total) in stats.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['profile'],
+        update_fields=['tests_taken', 'total_score', 'updated_at'],
+    )
+
+
+def refresh(profile_ids):
+    profile_ids = set(profile_ids)
+    if not profile_ids:
+        return
+    with transaction.atomic():
+        stats = compute(profile_ids)
+        store({profile_id: stats.get(profile_id, (0, 0)) for profile_id in profile_ids})
+
+
+def apply_increments(increments, created=()):
+    # Called inside the scoring transaction: existing rows get their score deltas, while
+    # profiles that gained a result (or have no stats row yet) are recomputed from scratch.
+    deltas = {}
+    for (profile_id, _), delta in increments.items():
+        deltas[profile_id] = deltas.get(profile_id, 0) + delta
+    stale = {profile_id for profile_id, _ in created}
+    deltas = {profile_id: delta for profile_id, delta in deltas.items() if delta and profile_id not in stale}
+    if deltas:
+        if len(deltas) == 1:
+            (_, delta), = deltas.items()
+            expression = Value(delta)
+        else:
+            expression = Case(*[When(profile_id=profile_id, then=Value(delta)) for profile_id, delta in deltas.items()],
+                              default=Value(0))
+        updated = main_models.ProfileStats.objects.filter(profile_id__in=deltas).update(
+            total_score=F('total_score') + expression)
+        if updated < len(deltas):
+            existing = set(main_models.ProfileStats.objects.filter(profile_id__in=deltas)
+                           .values_list('profile_id', flat=True))
+            stale.update(profile_id for profile_id in deltas if profile_id not in existing)
+    refresh(stale)
+
+
+def reset(profile_id):
+    if not main_models.ProfileStats.objects.filter(profile_id=profile_id).update(total_score=0):
+        refresh([profile_id])
+
+
+def check(batch_size=1000):
+    mismatches = []
+    last_id = 0
+    while True:
+        profile_ids = list(main_models.Profile.objects.filter(id__gt=last_id).order_by('id')
+                           .values_list('id', flat=True)[:batch_size])
+        if not profile_ids:
+            break
+        last_id = profile_ids[-1]
+        expected = compute(profile_ids)
+        stored = {row[0]: row[1:] for row in main_models.ProfileStats.objects.filter(profile_id__in=profile_ids)
+                  .values_list('profile_id', 'tests_taken', 'total_score')}
+        for profile_id in profile_ids:
+            want = expected.get(profile_id, (0, 0))
+            have = stored.get(profile_id)
+            if have != want and not (have is None and want == (0, 0)):
+                mismatches.append((profile_id, have, want))
+    return mismatches
+
+
+def rebuild(batch_size=1000):
+    rebuilt = 0
+    last_id = 0
+    while True:
+        profile_ids = list(main_models.Profile.objects.filter(id__gt=last_id).order_by('id')
+                           .values_list('id', flat=True)[:batch_size])
+        if not profile_ids:
+            break
+        last_id = profile_ids[-1]
+        refresh(profile_ids)
+        rebuilt += len(profile_ids)
+    return rebuilt
@@ -0,0 +1,837 @@
+import atexit
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from django.contrib.staticfiles import finders
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.views import APIView
+from rest_framework.test import APIClient, APIRequestFactory
+from . import models as main_models
+from . import answerkey as main_answerkey
+from . import compression as main_compression
+from . import leaderboard as main_leaderboard
+from . import media as main_media
+from . import metrics as main_metrics
+from . import middleware as main_middleware
+from . import async_views as main_async_views
+from . import authentication as main_authentication
+from . import cache as main_cache
+from . import database as main_database
+from . import errorlog as main_errorlog
+from . import notifications as main_notifications
+from . import paginator as main_paginator
+from . import questionbank as main_questionbank
+from . import ratelimit as main_ratelimit
+from . import registration as main_registration
+from . import scoring as main_scoring
+from . import staticfiles as main_staticfiles
+
+
+def create_profile(name):
+    user = main_models.User.objects.create(username=name)
+    return main_models.Profile.objects.create(user=user, name=name, phone_number=name)
+
+
+class ApplyIncrementsTests(TestCase):
+    def setUp(self):
+        self.p1 = create_profile('p1')
+        self.p2 = create_profile('p2')
+        self.t1 = main_models.Test.objects.create(title='t1')
+        self.t2 = main_models.Test.objects.create(title='t2')
+
+    def scores(self):
+        return dict(((user_id, test_id), score) for user_id, test_id, score in
+                    main_models.UserTestResult.objects.values_list('user_id', 'test_id', 'score'))
+
+    def test_batch_only_touches_its_own_keys(self):
+        for profile, test in ((self.p1, self.t1), (self.p1, self.t2), (self.p2, self.t1)):
+            main_models.UserTestResult.objects.create(user=profile, test=test, score=0)
+
+        main_scoring.apply_increments({(self.p1.id, self.t1.id): 1, (self.p2.id, self.t2.id): 2})
+
+        self.assertEqual(self.scores(), {
+            (self.p1.id, self.t1.id): 1,
+            (self.p1.id, self.t2.id): 0,
+            (self.p2.id, self.t1.id): 0,
+            (self.p2.id, self.t2.id): 2,
+        })
+        self.assertEqual(main_models.ProfileStats.objects.get(profile=self.p2).total_score, 2)
+
+    def test_batch_across_tests_updates_and_creates(self):
+        main_models.UserTestResult.objects.create(user=self.p1, test=self.t1, score=5)
+
+        main_scoring.apply_increments({
+            (self.p1.id, self.t1.id): 3,
+            (self.p1.id, self.t2.id): 1,
+            (self.p2.id, self.t1.id): 4,
+            (self.p2.id, self.t2.id): 0,
+        })
+
+        self.assertEqual(self.scores(), {
+            (self.p1.id, self.t1.id): 8,
+            (self.p1.id, self.t2.id): 1,
+            (self.p2.id, self.t1.id): 4,
+        })
+        self.assertEqual(main_models.ProfileStats.objects.get(profile=self.p1).total_score, 9)
+
+    def test_large_batch_is_chunked(self):
+        profiles = [create_profile(f'bulk{i}') for i in range(main_scoring.KEY_CHUNK_SIZE + 5)]
+        increments = {(profile.id, self.t1.id): 1 for profile in profiles}
+
+        main_scoring.apply_increments(increments)
+        main_scoring.apply_increments(increments)
+
+        self.assertEqual(set(self.scores().values()), {2})
+        self.assertEqual(len(self.scores()), len(profiles))
+
+    def test_single_key_creates_then_increments_without_select(self):
+        key = (self.p1.id, self.t1.id)
+        main_scoring.apply_increments({key: 2})
+        with CaptureQueriesContext(connection) as queries:
+            main_scoring.apply_increments({key: 3})
+
+        result_queries = [query['sql'] for query in queries if 'main_usertestresult' in query['sql']]
+        self.assertEqual(len(result_queries), 1)
+        self.assertTrue(result_queries[0].startswith('UPDATE'))
+
+        self.assertEqual(self.scores(), {key: 5})
+        self.assertEqual(main_models.ProfileStats.objects.get(profile=self.p1).total_score, 5)
+
+    def test_duplicate_result_rows_are_rejected(self):
+        main_models.UserTestResult.objects.create(user=self.p1, test=self.t1, score=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            main_models.UserTestResult.objects.create(user=self.p1, test=self.t1, score=1)
+
+
+class AnswerKeyTests(TestCase):
+    def setUp(self):
+        self.test = main_models.Test.objects.create(title='t')
+        question = main_models.Question.objects.create(text='q')
+        self.test.questions.add(question)
+        self.answer = main_models.Answer.objects.create(question=question, text='a', is_correct=False)
+        main_answerkey._keys.clear()
+
+    def tearDown(self):
+        main_answerkey._keys.clear()
+
+    def flip_elsewhere(self):
+        # Another process changes the answer: no signal runs here, so the cache version stays put.
+        main_models.Answer.objects.filter(id=self.answer.id).update(is_correct=True)
+
+    def test_key_is_reused_within_ttl(self):
+        self.assertEqual(main_answerkey.lookup_answer(self.test.id, self.answer.id), (self.answer.question_id, False))
+        self.flip_elsewhere()
+        self.assertEqual(main_answerkey.lookup_answer(self.test.id, self.answer.id), (self.answer.question_id, False))
+
+    def test_key_reloads_after_ttl(self):
+        main_answerkey.lookup_answer(self.test.id, self.answer.id)
+        self.flip_elsewhere()
+        with override_settings(ANSWER_KEY_TTL=0):
+            self.assertEqual(main_answerkey.lookup_answer(self.test.id, self.answer.id), (self.answer.question_id, True))
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica1'],
+    CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'pins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pins'},
+    },
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Not TestCase: reads inside a transaction on default never go to a replica.
+    databases = {'default', 'errors_db'}
+
+    def test_reads_use_replicas_only_inside_a_request(self):
+        self.assertEqual(main_models.Question.objects.all().db, 'default')
+        with main_database.request_scope():
+            self.assertEqual(main_models.Question.objects.all().db, 'replica1')
+            self.assertEqual(main_models.Profile.objects.all().db, 'default')
+            self.assertEqual(main_models.ErrorLog.objects.all().db, 'errors_db')
+
+    def test_write_pins_rest_of_request(self):
+        with main_database.request_scope():
+            main_models.Test.objects.create(title='t')
+            self.assertEqual(main_models.Question.objects.all().db, 'default')
+
+    def test_write_pins_client_for_next_requests(self):
+        with main_database.request_scope():
+            main_database.identify('token-a')
+            main_models.Test.objects.create(title='t')
+        with main_database.request_scope():
+            main_database.identify('token-a')
+            self.assertEqual(main_models.Question.objects.all().db, 'default')
+        with main_database.request_scope():
+            main_database.identify('token-b')
+            self.assertEqual(main_models.Question.objects.all().db, 'replica1')
+
+    def test_registration_pins_issued_token(self):
+        with main_database.request_scope():
+            token_key, created = main_registration.register('name', '+1 555')
+        self.assertTrue(created)
+        with main_database.request_scope():
+            main_database.identify(token_key)
+            self.assertEqual(main_models.UserTestResult.objects.all().db, 'default')
+
+    def test_viewing_queued_results_does_not_write(self):
+        profile = create_profile('p')
+        test = main_models.Test.objects.create(title='t')
+        result = main_models.UserTestResult.objects.create(user=profile, test=test, score=1)
+        with override_settings(NOTIFICATION_WORKER_AUTOSTART=False):
+            main_notifications.enqueue_results(profile, [result])
+            with main_database.request_scope() as state:
+                main_notifications.enqueue_results(profile, [result])
+        self.assertFalse(state['wrote'])
+        self.assertEqual(main_models.NotificationOutbox.objects.count(), 1)
+
+
+class ScoreBufferResetTests(TransactionTestCase):
+    def setUp(self):
+        self.profile = create_profile('p')
+        self.test = main_models.Test.objects.create(title='t')
+        main_models.UserTestResult.objects.create(user=self.profile, test=self.test, score=0)
+        self.buffer = main_scoring._buffer = main_scoring.ScoreBuffer(interval=60, threshold=10 ** 6)
+        self.buffer.thread = object()
+
+    def tearDown(self):
+        main_scoring._buffer = None
+
+    def score(self):
+        return main_models.UserTestResult.objects.get(user=self.profile, test=self.test).score
+
+    def test_reset_drops_pending_increments(self):
+        self.buffer.add((self.profile.id, self.test.id), 3)
+        main_scoring.reset(self.profile.id)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.score(), 0)
+
+    def test_reset_waits_for_in_flight_flush(self):
+        self.buffer.add((self.profile.id, self.test.id), 3)
+        started, release = threading.Event(), threading.Event()
+        apply_increments = main_scoring.apply_increments
+
+        def slow_apply(increments):
+            started.set()
+            release.wait(5)
+            apply_increments(increments)
+
+        with mock.patch.object(main_scoring, 'apply_increments', slow_apply):
+            flusher = threading.Thread(target=self.buffer.flush)
+            flusher.start()
+            started.wait(5)
+            resetter = threading.Thread(target=main_scoring.reset, args=(self.profile.id,))
+            resetter.start()
+            resetter.join(0.2)
+            self.assertTrue(resetter.is_alive())
+            release.set()
+            flusher.join(5)
+            resetter.join(5)
+        self.assertEqual(self.score(), 0)
+
+
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        self.profile = create_profile('async')
+        self.token = Token.objects.create(user=self.profile.user)
+        self.test = main_models.Test.objects.create(title='async')
+        question = main_models.Question.objects.create(text='q')
+        self.test.questions.add(question)
+        self.answer = main_models.Answer.objects.create(question=question, text='a', is_correct=True)
+
+    async def test_malformed_json_is_a_bad_request(self):
+        view = main_async_views.AsyncRegisterAPIView.as_view()
+        response = await view(self.factory.post('/', data='{"name": ', content_type='application/json'))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_answer_is_scored(self):
+        view = main_async_views.AsyncAnswerAPIView.as_view()
+        request = self.factory.post('/', data={'answer_id': self.answer.id}, content_type='application/json',
+                                    headers={'Authorization': f'Token {self.token.key}'})
+        response = await view(request, test_id=self.test.id)
+        self.assertEqual(response.status_code, 200)
+        result = await main_models.UserTestResult.objects.aget(user=self.profile, test=self.test)
+        self.assertEqual(result.score, 1)
+
+    async def test_unknown_token_is_rejected(self):
+        view = main_async_views.AsyncQuestionAPIView.as_view()
+        response = await view(self.factory.get('/', headers={'Authorization': 'Token missing'}))
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(WHITENOISE_AUTOREFRESH=True, WHITENOISE_USE_FINDERS=True)
+class AsyncStaticFilesTests(TestCase):
+    async def request(self, path):
+        async def application(scope, receive, send):
+            await send({'type': 'http.response.start', 'status': 204, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': [(b'accept-encoding', b'identity')]}
+        await main_staticfiles.AsyncStaticFiles(application)(scope, None, send)
+        return messages[0]['status'], b''.join(message.get('body', b'') for message in messages[1:])
+
+    async def test_serves_static_file(self):
+        status, body = await self.request('/static/main/admin/autocomplete_filter.js')
+        self.assertEqual(status, 200)
+        with open(finders.find('main/admin/autocomplete_filter.js'), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    async def test_passes_other_paths_through(self):
+        status, body = await self.request('/api/v1/tests/')
+        self.assertEqual(status, 204)
+
+
+class PaginatorTests(TestCase):
+    databases = {'default', 'errors_db'}
+
+    def setUp(self):
+        # Pruned error logs leave large gaps between ids.
+        for error_id in (1, 5000, 90000):
+            main_models.ErrorLog.objects.create(id=error_id, error_number=str(error_id), error_message='boom',
+                                                user_agent='test', ip_address='127.0.0.1')
+
+    def test_sparse_ids_are_not_estimated(self):
+        queryset = main_models.ErrorLog.objects.order_by('-id')
+        self.assertEqual(main_paginator.estimate_count(queryset), None)
+        self.assertEqual(main_paginator.EstimatedCountPaginator(queryset, 100).count, 3)
+        self.assertEqual(main_paginator.CappedCountPaginator(queryset, 100).count, 3)
+
+    @override_settings(ADMIN_PAGINATOR={'max_count': 2})
+    def test_count_is_capped(self):
+        queryset = main_models.ErrorLog.objects.order_by('-id')
+        self.assertEqual(main_paginator.CappedCountPaginator(queryset, 1).count, 2)
+
+
+class GZipCacheTests(TestCase):
+    def compress(self, response):
+        middleware = main_middleware.GZipMiddleware(lambda request: response)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(middleware(request)['Content-Encoding'], 'gzip')
+        return middleware.cache
+
+    def body(self):
+        return HttpResponse(b'{"question": 1}' * 100, content_type='application/json')
+
+    def test_unmarked_bodies_are_not_cached(self):
+        self.assertEqual(len(self.compress(self.body()).entries), 0)
+
+    def test_shared_bodies_are_cached(self):
+        self.assertEqual(len(self.compress(main_compression.mark_shared(self.body())).entries), 1)
+
+
+class FileExporterTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.exporter = main_metrics.FileExporter(main_metrics.MetricsRegistry(), self.directory, 5, max_age=60)
+        self.addCleanup(atexit.unregister, self.exporter.write)
+        self.addCleanup(shutil.rmtree, self.directory, True)
+
+    def write(self, pid, value, age=0):
+        path = os.path.join(self.directory, f'metrics-{pid}.json')
+        with open(path, 'w') as f:
+            json.dump({'histograms': [], 'counters': [['requests', [], value]], 'gauges': []}, f)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def collected(self):
+        return self.exporter.collect()[1].get(('requests', ()))
+
+    def test_live_worker_is_merged(self):
+        self.write(os.getppid(), 3)
+        self.assertEqual(self.collected(), 3)
+
+    def test_exited_worker_is_deleted(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        path = self.write(process.pid, 3)
+        self.assertEqual(self.collected(), None)
+        self.assertFalse(os.path.exists(path))
+
+    def test_stale_file_is_skipped(self):
+        self.write(os.getppid(), 3, age=120)
+        self.assertEqual(self.collected(), None)
+
+
+class LeaderboardRebuildTests(TransactionTestCase):
+    def setUp(self):
+        self.test = main_models.Test.objects.create(title='board')
+        self.profile = create_profile('board')
+        main_models.UserTestResult.objects.create(user=self.profile, test=self.test, score=1)
+        self.addCleanup(main_leaderboard._boards.pop, self.test.id, None)
+
+    def test_stale_board_is_served_while_rebuilding(self):
+        board = main_leaderboard.get_board(self.test.id)
+        main_models.UserTestResult.objects.filter(user=self.profile).update(score=7)
+        board.loaded_at -= main_leaderboard.get_refresh_interval()
+
+        self.assertIs(main_leaderboard.get_board(self.test.id), board)
+        for thread in threading.enumerate():
+            if thread.name == f'leaderboard-{self.test.id}':
+                thread.join()
+        self.assertEqual(main_leaderboard.get_board(self.test.id).score(self.profile.id), 7)
+
+
+class QuestionIdsTests(TestCase):
+    def setUp(self):
+        self.test = main_models.Test.objects.create(title='ids')
+        self.test.questions.add(main_models.Question.objects.create(text='q1'))
+        self.addCleanup(main_cache._question_ids.pop, self.test.id, None)
+
+    def test_ids_are_shared_within_a_version(self):
+        question_ids = main_cache.get_question_ids(self.test.id)
+        self.assertIs(main_cache.get_question_ids(self.test.id), question_ids)
+
+    def test_ids_reload_on_new_version(self):
+        self.assertEqual(len(main_cache.get_question_ids(self.test.id)), 1)
+        self.test.questions.add(main_models.Question.objects.create(text='q2'))
+        main_cache.invalidate()
+        self.assertEqual(len(main_cache.get_question_ids(self.test.id)), 2)
+
+
+class ErrorLogMetricsTests(TestCase):
+    def counter(self, outcome):
+        return main_metrics.registry.counters.get(('error_log_entries_total', (('outcome', outcome),)), 0)
+
+    def test_writer_outcomes_are_exported(self):
+        enqueued, dropped = self.counter('enqueued'), self.counter('dropped')
+        writer = main_errorlog.ErrorLogWriter(max_size=1)
+        with mock.patch.object(writer, 'start'):
+            writer.put({'fingerprint': 'a'})
+            writer.put({'fingerprint': 'b'})
+        self.assertEqual(self.counter('enqueued'), enqueued + 1)
+        self.assertEqual(self.counter('dropped'), dropped + 1)
+
+
+class FakeMemcache:
+    # Just enough of pymemcache's gets/add/cas. `racing` runs between a client's gets and its
+    # cas, the way another worker's write would.
+    def __init__(self, racing=None):
+        self.values = {}
+        self.racing = racing
+        self.cas_calls = 0
+
+    def gets(self, key):
+        return self.values.get(key, (None, None))
+
+    def add(self, key, value, expire=0, noreply=True):
+        if self.racing is not None:
+            self.racing(self)
+        if key in self.values:
+            return False
+        self.values[key] = (value.encode(), 1)
+        return True
+
+    def cas(self, key, value, cas, expire=0, noreply=True):
+        self.cas_calls += 1
+        if self.racing is not None:
+            self.racing(self)
+        current = self.values.get(key)
+        if current is None or current[1] != cas:
+            return False
+        self.values[key] = (value.encode(), cas + 1)
+        return True
+
+
+class RateLimitTests(TestCase):
+    def limiter(self, store, capacity=2, period=10, routes=None):
+        self.now = 1000.0
+        return main_ratelimit.TokenBucketLimiter(store, (capacity, period), routes, clock=lambda: self.now)
+
+    def test_refill(self):
+        limiter = self.limiter(main_ratelimit.LocalStore())
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 1, 0))
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 0, 0))
+        # 0.2 tokens per second: the next token is 5 seconds away.
+        self.assertEqual(limiter.check('ip', '/'), (False, 2, 0, 5))
+        self.now += 2.5
+        self.assertEqual(limiter.check('ip', '/'), (False, 2, 0, 3))
+        self.now += 2.5
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 0, 0))
+        self.now += 60
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 1, 0))
+
+    def test_longest_route_prefix_wins(self):
+        limiter = self.limiter(main_ratelimit.LocalStore(), routes={'/api/': (5, 60), '/api/v1/register/': (1, 60)})
+        self.assertEqual(limiter.limit_for('/api/v1/register/'), ('/api/v1/register/', (1, 60)))
+        self.assertEqual(limiter.limit_for('/api/v1/questions/'), ('/api/', (5, 60)))
+        self.assertEqual(limiter.limit_for('/admin/'), ('*', (2, 10)))
+        # Routes have their own buckets.
+        self.assertTrue(limiter.check('ip', '/api/v1/register/')[0])
+        self.assertFalse(limiter.check('ip', '/api/v1/register/')[0])
+        self.assertTrue(limiter.check('ip', '/api/v1/questions/')[0])
+
+    def test_url_names_win_over_prefixes(self):
+        limiter = self.limiter(main_ratelimit.LocalStore(),
+                               routes={'/api/': (5, 60), ('question', 'test-question'): (1, 60)})
+        self.assertEqual(limiter.limit_for('/api/v1/tests/1/questions/', 'test-question'),
+                         ('question,test-question', (1, 60)))
+        self.assertEqual(limiter.limit_for('/api/v1/tests/1/result/', 'test-result'), ('/api/', (5, 60)))
+        # Names in one tuple share a bucket.
+        self.assertTrue(limiter.check('ip', '/api/v1/questions/', 'question')[0])
+        self.assertFalse(limiter.check('ip', '/api/v1/tests/1/questions/', 'test-question')[0])
+
+    @override_settings(RATE_LIMIT={'routes': {('question', 'test-question'): (300, 60)}})
+    def test_middleware_keys_on_resolved_url_name(self):
+        middleware = main_middleware.RateLimitMiddleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().get('/api/v1/tests/1/questions/'))
+        self.assertEqual(response['X-RateLimit-Limit'], '300')
+        response = middleware(RequestFactory().get('/no/such/page/'))
+        self.assertEqual(response['X-RateLimit-Limit'], '100')
+
+    def test_local_store_evicts_least_recently_used(self):
+        store = main_ratelimit.LocalStore(max_entries=2)
+        limiter = self.limiter(store)
+        for ip in ('a', 'b', 'a', 'c'):
+            limiter.check(ip, '/')
+        self.assertEqual(list(store.buckets), ['rl:*:a', 'rl:*:c'])
+
+    def test_cas_conflict_is_retried_against_the_new_value(self):
+        def racing(client):
+            # Another worker takes a token between the first gets and cas.
+            if client.cas_calls == 1:
+                value, cas = client.values['rl:*:ip']
+                client.values['rl:*:ip'] = (b'0.000000:1000.000000', cas + 1)
+
+        client = FakeMemcache()
+        limiter = self.limiter(main_ratelimit.MemcacheStore(client), capacity=2)
+        self.assertTrue(limiter.check('ip', '/')[0])
+        client.racing = racing
+        self.assertEqual(limiter.check('ip', '/'), (False, 2, 0, 5))
+        self.assertEqual(client.cas_calls, 2)
+        self.assertEqual(client.values['rl:*:ip'][0], b'0.000000:1000.000000')
+
+    def test_add_race_falls_back_to_cas(self):
+        def racing(client):
+            client.racing = None
+            client.values['rl:*:ip'] = (b'1.000000:1000.000000', 7)
+
+        client = FakeMemcache(racing)
+        limiter = self.limiter(main_ratelimit.MemcacheStore(client), capacity=2)
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 0, 0))
+        self.assertEqual(client.values['rl:*:ip'], (b'0.000000:1000.000000', 8))
+
+    def test_gives_up_after_max_retries(self):
+        def racing(client):
+            value, cas = client.values['rl:*:ip']
+            client.values['rl:*:ip'] = (value, cas + 1)
+
+        client = FakeMemcache()
+        store = main_ratelimit.MemcacheStore(client, max_retries=3)
+        limiter = self.limiter(store, capacity=2)
+        limiter.check('ip', '/')
+        client.racing = racing
+        self.assertEqual(limiter.check('ip', '/'), (True, 2, 0, 0))
+        self.assertEqual(client.cas_calls, 3)
+
+
+@override_settings(NOTIFICATION_WORKER_AUTOSTART=False)
+class LocalTransportTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile('notify')
+        test = main_models.Test.objects.create(title='t')
+        self.results = [main_models.UserTestResult.objects.create(user=self.profile, test=test, score=1)]
+        outbox = mock.patch.object(main_notifications.LocalTransport, 'outbox', [])
+        outbox.start()
+        self.addCleanup(outbox.stop)
+
+    def worker(self, transport):
+        return main_notifications.OutboxWorker(transport, global_rate=1000, chat_rate=1000)
+
+    def test_drain_delivers_to_local_transport(self):
+        main_notifications.enqueue_results(self.profile, self.results)
+        self.assertEqual(self.worker(main_notifications.LocalTransport()).drain(), 1)
+        self.assertEqual(len(main_notifications.LocalTransport.outbox), 1)
+        chat_id, text = main_notifications.LocalTransport.outbox[0]
+        self.assertIn(self.profile.name, text)
+        entry = main_models.NotificationOutbox.objects.get()
+        self.assertEqual(entry.status, main_models.NotificationOutbox.STATUS_SENT)
+
+    def test_failed_send_is_rescheduled(self):
+        transport = main_notifications.LocalTransport()
+        main_notifications.enqueue_results(self.profile, self.results)
+        with mock.patch.object(transport, 'send', side_effect=ConnectionError('down')):
+            self.worker(transport).drain()
+        entry = main_models.NotificationOutbox.objects.get()
+        self.assertEqual((entry.status, entry.tries, entry.last_error),
+                         (main_models.NotificationOutbox.STATUS_PENDING, 1, 'down'))
+        self.assertEqual(main_notifications.LocalTransport.outbox, [])
+
+
+class SampledGradingTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile('sampled')
+        self.test = main_models.Test.objects.create(title='sampled', sample_size=2)
+        self.answers = {}
+        for number in range(6):
+            question = main_models.Question.objects.create(text=f'q{number}')
+            self.test.questions.add(question)
+            self.answers[question.id] = main_models.Answer.objects.create(question=question, text='a', is_correct=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.profile.user).key)
+        self.addCleanup(main_cache._question_ids.pop, self.test.id, None)
+        self.addCleanup(main_answerkey._keys.pop, self.test.id, None)
+
+    def served(self):
+        response = self.client.get(f'/api/v1/tests/{self.test.id}/questions/')
+        return [question['id'] for question in response.json()]
+
+    def answer_ids(self, question_ids):
+        return [self.answers[question_id].id for question_id in question_ids]
+
+    def test_bulk_grading_only_accepts_served_questions(self):
+        served = self.served()
+        self.assertEqual(len(served), 2)
+        url = f'/api/v1/tests/{self.test.id}/answers/'
+        response = self.client.post(url, {'answer_ids': self.answer_ids(self.answers)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'answer_ids': self.answer_ids(served)}, format='json')
+        self.assertEqual(response.json()['score'], 2)
+
+    def test_single_answer_must_be_served(self):
+        served = self.served()
+        unserved = [question_id for question_id in self.answers if question_id not in served]
+        url = f'/api/v1/tests/{self.test.id}/answer/'
+        response = self.client.post(url, {'answer_id': self.answer_ids(unserved)[0]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(url, {'answer_id': self.answer_ids(served)[0]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class MediaSweeperTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, True)
+
+    def create(self, name, age):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as f:
+            f.write('x')
+        os.utime(path, (time.time() - age, time.time() - age))
+        return path
+
+    def counter(self, name):
+        return main_metrics.registry.counters.get((f'media_{name}_total', ()), 0)
+
+    def test_loop_sweeps_use_the_heap_between_rescans(self):
+        sweeper = main_media.MediaSweeper(self.root, ttl=10, interval=1, rescan_interval=60)
+        deleted = self.counter('files_deleted')
+        old = self.create('old', 60)
+        fresh = self.create('fresh', 0)
+        self.assertEqual(sweeper.sweep(), {'scanned': 2, 'deleted': 1, 'tracked': 1, 'seconds': mock.ANY})
+        self.assertFalse(os.path.exists(old))
+        # Not rescanned: the tracked file expires from the heap, the new one waits for the next scan.
+        self.create('later', 60)
+        self.assertEqual(sweeper.sweep(now=time.time() + 20)['scanned'], 0)
+        self.assertFalse(os.path.exists(fresh))
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'later')))
+        self.assertEqual(self.counter('files_deleted'), deleted + 2)
+
+    def test_command_scans_once(self):
+        self.create('old', 60)
+        out = io.StringIO()
+        with override_settings(MEDIA_ROOT=self.root, MEDIA_FILE_TTL=10):
+            call_command('sweep_media', stdout=out)
+        self.assertIn('Scanned 1 files, deleted 1', out.getvalue())
+
+
+@override_settings(TELEGRAM_BOT_TOKEN='', NOTIFICATION_TRANSPORT='main.notifications.TelegramTransport')
+class UnconfiguredTransportTests(TestCase):
+    def test_worker_is_not_built_without_token(self):
+        with self.assertLogs('main.notifications', 'WARNING'):
+            self.assertIsNone(main_notifications.build_worker())
+
+    def test_drain_outbox_refuses_to_run(self):
+        with self.assertLogs('main.notifications', 'WARNING'), self.assertRaises(CommandError):
+            call_command('drain_outbox')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.profile = create_profile('auth')
+        self.token = Token.objects.create(user=self.profile.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def get(self):
+        return self.client.get('/api/v1/tests/').status_code
+
+    def test_deleted_token_is_rejected(self):
+        self.assertEqual(self.get(), 200)
+        self.token.delete()
+        self.assertEqual(self.get(), 401)
+
+    def test_inactive_user_is_rejected(self):
+        self.assertEqual(self.get(), 200)
+        self.profile.user.is_active = False
+        self.profile.user.save()
+        self.assertEqual(self.get(), 401)
+
+    def test_profile_is_attached(self):
+        request = APIView().initialize_request(
+            APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + self.token.key))
+        user, token = main_authentication.CachedTokenAuthentication().authenticate(request)
+        self.assertEqual((user, token.key), (self.profile.user, self.token.key))
+        self.assertEqual(request.profile, self.profile)
+
+    def test_local_cache_expires_and_evicts(self):
+        now = [0.0]
+        cache = main_authentication.LocalTokenCache(ttl=60, max_entries=2, clock=lambda: now[0])
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        # 'b' was the least recently used.
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        now[0] = 60
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache.entries), 1)
+
+
+class ResultsExportTests(TestCase):
+    url = '/api/v1/results/export/'
+
+    def setUp(self):
+        self.profile = create_profile('export')
+        self.test = main_models.Test.objects.create(title='export')
+        self.result = main_models.UserTestResult.objects.create(user=self.profile, test=self.test, score=3)
+        self.staff = main_models.User.objects.create(username='staff', is_staff=True)
+
+    def token_client(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=user).key)
+        return client
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_non_staff_is_forbidden(self):
+        self.assertEqual(self.token_client(self.profile.user).get(self.url).status_code, 403)
+        self.assertEqual(Client().get(self.url).status_code, 403)
+
+    def test_staff_token_gets_csv(self):
+        response = self.token_client(self.staff).get(self.url, {'test': self.test.id})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'profile_id', 'name'])
+        self.assertEqual(lines[1].split(',')[:3], [str(self.result.id), str(self.profile.id), 'export'])
+
+    def test_staff_session_gets_jsonl(self):
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get(self.url, {'format': 'jsonl', 'from': '2000-01-01'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([(row['id'], row['score']) for row in rows], [(self.result.id, 3)])
+
+    def test_filters_are_applied(self):
+        client = self.token_client(self.staff)
+        self.assertEqual(self.content(client.get(self.url, {'format': 'jsonl', 'to': '2000-01-01'})), '')
+        self.assertEqual(self.content(client.get(self.url, {'format': 'jsonl', 'test': self.test.id + 1})), '')
+
+    def test_malformed_filters_are_bad_requests(self):
+        client = self.token_client(self.staff)
+        for params in ({'from': '2024-13-01'}, {'to': 'yesterday'}, {'test': 'abc'}, {'format': 'xml'}):
+            self.assertEqual(client.get(self.url, params).status_code, 400, params)
+
+
+class RegistrationTests(TestCase):
+    def setUp(self):
+        self.test = main_models.Test.objects.create(title='default')
+
+    def test_phone_spellings_resolve_to_one_user(self):
+        token_key, created = main_registration.register('Ann', '+998 (90) 123-45-67')
+        self.assertTrue(created)
+        self.assertEqual(main_registration.register('Ann', '998901234567'), (token_key, False))
+        self.assertEqual(main_models.Profile.objects.get().normalized_phone, '998901234567')
+        self.assertEqual(main_models.User.objects.count(), 1)
+
+    def test_concurrent_registration_falls_back_to_existing_profile(self):
+        token_key, _ = main_registration.register('Ann', '1')
+        find_profile = main_registration.find_profile
+        # The other request commits between this request's lookup and its insert.
+        with mock.patch.object(main_registration, 'find_profile', side_effect=[None, find_profile('Ann', '1')]):
+            self.assertEqual(main_registration.register('Ann', '1'), (token_key, False))
+        self.assertEqual(main_models.Profile.objects.count(), 1)
+
+    def test_password_is_unusable_by_default(self):
+        main_registration.register('Ann', '1')
+        self.assertFalse(main_models.User.objects.get().has_usable_password())
+
+    @override_settings(REGISTRATION_SET_PASSWORD=True)
+    def test_password_can_be_set_to_phone_number(self):
+        main_registration.register('Ann', '1')
+        self.assertTrue(main_models.User.objects.get().check_password('1'))
+
+    def test_reregistration_starts_a_new_attempt(self):
+        main_registration.register('Ann', '1')
+        main_models.UserTestResult.objects.update(score=5)
+        main_registration.register('Ann', '1')
+        result = main_models.UserTestResult.objects.get(test=self.test)
+        self.assertEqual((result.score, result.attempt), (0, 2))
+
+    def test_invalid_identity_is_rejected(self):
+        with self.assertRaises(main_registration.RegistrationError):
+            main_registration.register(' ', '1')
+        with self.assertRaises(main_registration.RegistrationError):
+            main_registration.register('Ann', 'none')
+
+
+class QuestionBankTests(TestCase):
+    def parse(self, text):
+        return list(main_questionbank.parse_csv(io.StringIO(text)))
+
+    def test_question_id_keeps_repeated_text_apart(self):
+        records = self.parse('question_id,question,answer,is_correct\n'
+                             '1,Same?,yes,1\n1,Same?,no,0\n2,Same?,yes,0\n2,Same?,no,1\n')
+
+        self.assertEqual(records, [('Same?', [('yes', True), ('no', False)]),
+                                   ('Same?', [('yes', False), ('no', True)])])
+
+    def test_blank_lines_separate_questions_without_question_id(self):
+        records = self.parse('question,answer,is_correct\nSame?,yes,1\n\nSame?,no,1\n,,\nOther?,a,0\n')
+
+        self.assertEqual(records, [('Same?', [('yes', True)]), ('Same?', [('no', True)]), ('Other?', [('a', False)])])
+
+    def test_rows_of_one_question_must_agree(self):
+        with self.assertRaisesMessage(main_questionbank.QuestionBankError, 'Line 3: question text differs'):
+            self.parse('question,answer,is_correct\nOne?,a,1\nTwo?,b,1\n')
+        with self.assertRaisesMessage(main_questionbank.QuestionBankError, 'Line 4: question_id 1 was already used'):
+            self.parse('question_id,question,answer,is_correct\n1,One?,a,1\n2,Two?,b,1\n1,One?,c,0\n')
+
+    def test_export_round_trips(self):
+        for text in ('Same?', 'Same?', 'Empty?'):
+            question = main_models.Question.objects.create(text=text)
+            if text != 'Empty?':
+                main_models.Answer.objects.create(question=question, text='yes', is_correct=True)
+        exported = ''.join(main_questionbank.export_questions(fmt='csv'))
+
+        self.assertEqual(self.parse(exported), [('Same?', [('yes', True)]), ('Same?', [('yes', True)]), ('Empty?', [])])
+
+    def test_import_error_mentions_committed_chunks_only_after_one(self):
+        with self.assertRaises(main_questionbank.QuestionBankError) as raised:
+            main_questionbank.import_questions(main_questionbank.parse_csv(io.StringIO('question\n')))
+        self.assertNotIn('imported', str(raised.exception))
+
+        bank = 'question,answer,is_correct\nOne?,a,1\n\nTwo?,b,1\n\n,x,1\n'
+        with self.assertRaises(main_questionbank.QuestionBankError) as raised:
+            main_questionbank.import_questions(main_questionbank.parse_csv(io.StringIO(bank)), chunk_size=1)
+        self.assertEqual(str(raised.exception),
+                         'Line 6: question text is empty (2 questions before this line were imported)')
+        self.assertEqual(main_models.Question.objects.count(), 2)
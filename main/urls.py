@@ -5,6 +5,15 @@ urlpatterns = [
     path('register/', main_views.RegisterAPIView.as_view(), name="register"),
     path('questions/', main_views.QuestionAPIView.as_view(), name="question"),
     path('answer/', main_views.AnswerAPIView.as_view(), name="answer"),
+    path('answers/', main_views.BulkAnswerAPIView.as_view(), name="answers"),
     path('result/', main_views.ResultAPIView.as_view(), name="result"),
+    path('leaderboard/', main_views.LeaderboardAPIView.as_view(), name="leaderboard"),
+    path('results/export/', main_views.results_export_view, name="results-export"),
+    path('tests/', main_views.TestListAPIView.as_view(), name="tests"),
+    path('tests/<int:test_id>/questions/', main_views.QuestionAPIView.as_view(), name="test-question"),
+    path('tests/<int:test_id>/answer/', main_views.AnswerAPIView.as_view(), name="test-answer"),
+    path('tests/<int:test_id>/answers/', main_views.BulkAnswerAPIView.as_view(), name="test-answers"),
+    path('tests/<int:test_id>/result/', main_views.ResultAPIView.as_view(), name="test-result"),
+    path('tests/<int:test_id>/leaderboard/', main_views.LeaderboardAPIView.as_view(), name="test-leaderboard"),
 ]
  
\ No newline at end of file
@@ -1,13 +1,22 @@
-import uuid
-from rest_framework import views, status
+from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from . import models as main_models
 from . import serializers as main_serializers
+from . import cache as main_cache
+from . import compression as main_compression
+from . import scoring as main_scoring
+from . import notifications as main_notifications
+from . import errorlog as main_errorlog
+from . import grading as main_grading
+from . import leaderboard as main_leaderboard
+from . import registration as main_registration
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework.authentication import TokenAuthentication
-from rest_framework.authtoken.models import Token
+from django.http import HttpResponse, JsonResponse
+from . import metrics as main_metrics
+from . import authentication as main_authentication
+from . import resultexport as main_resultexport
 
 
 
@@ -37,165 +46,195 @@ class RegisterAPIView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        error_code = str(uuid.uuid4())[:15]
         try:
             name = request.data.get('name')
             phone_number = request.data.get('phone_number')
             
             if name is None or phone_number is None:
-                error_log = main_models.ErrorLog.objects.create(
-                    error_number=error_code,
-                    error_message='Username or password is missing.',
-                    user_agent=request.META.get('HTTP_USER_AGENT'),
-                    ip_address=request.META.get('REMOTE_ADDR'),
-                )
+                error_code = main_errorlog.log_error(request, 'Username or password is missing.')
                 return Response({'error': 'Username or password is missing. Error ID: {}'.format(error_code)},
                                 status=status.HTTP_400_BAD_REQUEST)
-            
-            username = f'{name}{phone_number}'
-            if main_models.User.objects.filter(username=username).exists():
-                profile = main_models.Profile.objects.get(user=main_models.User.objects.get(username=username))
-                result = main_models.UserTestResult.objects.get(user=profile)
-                result.score = 0
-                result.save()
-                token, _ = Token.objects.get_or_create(user=main_models.User.objects.get(username=username))
 
+            try:
+                token_key, created = main_registration.register(name, phone_number)
+            except main_registration.RegistrationError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-                
+            if not created:
                 return Response({'success': 'User with this username already exists.',
-                                 'user_token':token.key
+                                 'user_token': token_key
                                  },
                                 status=status.HTTP_200_OK)
             
-            user = main_models.User.objects.create(username=username)
-            user.set_password(phone_number)
-            user.save()
-            
-            profile = main_models.Profile.objects.create(user=user, name=name, phone_number=phone_number)
-            test = main_models.Test.objects.first()
-            result = main_models.UserTestResult.objects.create(user=profile, test=test, score=0)
-            
-            token, _ = Token.objects.get_or_create(user=user)
-            
             return Response({'success': 'User created successfully.',
-                             'user_token': token.key
+                             'user_token': token_key
                              }, status=status.HTTP_201_CREATED)
         except Exception as e:
-            error_log = main_models.ErrorLog.objects.create(
-                error_number=error_code,
-                error_message=str(e),
-                user_agent=request.META.get('HTTP_USER_AGENT'),
-                ip_address=request.META.get('REMOTE_ADDR'),
-            )
+            error_code = main_errorlog.log_error(request, e)
             return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)},
                             status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class QuestionAPIView(APIView):
+class TestListAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
-    serializer_class = main_serializers.QuestionSerializer
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
 
     def get(self, request):
-        error_code = str(uuid.uuid4())[:15]
-
         try:
-            first_test = main_models.Test.objects.first()
-            if not first_test:
-                return Response({'error': 'No tests available'}, status=status.HTTP_404_NOT_FOUND)
+            return main_compression.mark_shared(Response(list(main_cache.get_catalog()['tests'].values())))
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            queryset = main_models.Question.objects.filter(test=first_test).prefetch_related('answers').order_by('?')
-            if not queryset.exists():
-                return Response({'error': 'No questions available for the first test'}, status=status.HTTP_404_NOT_FOUND)
-            
-            serializer = self.serializer_class(queryset, many=True, context={'request': request})
-            return Response(serializer.data)
+class QuestionAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
+    serializer_class = main_serializers.QuestionSerializer
+
+    def get(self, request, test_id=None):
+        try:
+            version = main_cache.get_version()
+            test = main_cache.resolve_test(test_id, version)
+            if test is None:
+                return Response({'error': 'Test not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            if test['sample_size']:
+                seed = main_models.UserTestResult.get_attempt_seed(request.user.id, test['id'])
+                questions = main_cache.get_sampled_questions(test['id'], test['sample_size'], seed, version)
+            else:
+                questions = main_cache.get_shuffled_question_set(test['id'], version)
+            if not questions:
+                return Response({'error': 'No questions available for this test'}, status=status.HTTP_404_NOT_FOUND)
+
+            return Response(questions)
         except Exception as e:
-            error_log = main_models.ErrorLog.objects.create(
-                error_number=error_code,
-                error_message=str(e),
-                user_agent=request.META.get('HTTP_USER_AGENT'),
-                ip_address=request.META.get('REMOTE_ADDR'),
-            )
-            return Response({'error': 'An error occurred. Error ID: {}'.format(error_log.error_number)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class AnswerAPIView(APIView):
     permission_classes = [IsAuthenticated]
-    authentication_classes = [TokenAuthentication]
-
-    def post(self, request):
-        error_code = str(uuid.uuid4())[:15]
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
 
+    def post(self, request, test_id=None):
         try:
-            user = main_models.Profile.objects.get(user=request.user)
+            user = request.profile
             answer_id = request.data.get('answer_id')
 
             if user is None or answer_id is None:
                 return Response({'error': 'User or answer ID is missing'}, status=status.HTTP_400_BAD_REQUEST)
 
-            answer = main_models.Answer.objects.get(id=answer_id)
+            test = main_cache.resolve_test(test_id)
+            if test is None:
+                return Response({'error': 'Test not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            if answer is None or not answer.is_correct:
+            answer = main_grading.lookup_answer(test, request.user.id, answer_id)
+
+            if answer is None or not answer[1]:
                 return Response({'error': 'Invalid answer'}, status=status.HTTP_400_BAD_REQUEST)
 
-            user_test_result, created = main_models.UserTestResult.objects.get_or_create(user=user)
-            user_test_result.score += 1
-            user_test_result.save()
+            main_scoring.increment(user.id, test['id'])
 
             return Response({'success': 'Score updated successfully'}, status=status.HTTP_200_OK)
 
         except Exception as e:
-            error_log = main_models.ErrorLog.objects.create(
-                error_number=error_code,
-                error_message=str(e),
-                user_agent=request.META.get('HTTP_USER_AGENT'),
-                ip_address=request.META.get('REMOTE_ADDR'),
-            )
-            return Response({'error': 'An error occurred. Error ID: {}'.format(error_log.error_number)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-import telebot
+class BulkAnswerAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
+
+    def post(self, request, test_id=None):
+        try:
+            user = request.profile
+            test = main_cache.resolve_test(test_id)
+            if test is None:
+                return Response({'error': 'Test not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            try:
+                score = main_grading.grade(test, request.user.id, request.data.get('answer_ids'))
+            except main_grading.GradingError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-bot = telebot.TeleBot('6367382297:AAHIj-h6yef4koM07DkoPgg-408WfUy0s5A')
+            main_scoring.set_score(user.id, test['id'], score)
+            return Response({'success': 'Answers graded successfully', 'score': score}, status=status.HTTP_200_OK)
+
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class ResultAPIView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
-    def get(self, request):
-        user = request.user
+    def get(self, request, test_id=None):
         try:
-            profile = user.profile
-            test_results = main_models.UserTestResult.objects.filter(user=profile)
-            question_count = main_models.Question.objects.count()
-    
+            profile = request.profile
+            if profile is None:
+                raise main_models.Profile.DoesNotExist('Profile not found')
+            test_results = main_models.UserTestResult.objects.filter(user=profile).select_related('test')
+            if test_id is not None:
+                test_results = test_results.filter(test_id=test_id)
             data = []
             for result in test_results:
+                result.score += main_scoring.buffered(profile.id, result.test_id)
                 data.append({
+                    'test_id': result.test_id,
                     'test_title': result.test.title,
                     'score': result.score,
                     'date_taken': result.date_taken,
-                    "question_count":question_count
+                    "question_count":result.test.served_question_count,
+                    **main_leaderboard.describe(result.test_id, result.score),
                 })
-                bot.send_message('-1002137089103', 
-                f'''Lid:
-Ismi: {profile.name}
-Telefoni: {profile.phone_number}
-Togri javoblar: {result.score}
-Umumiy savolar soni: {question_count}
 
-                ''')
+            main_notifications.enqueue_results(profile, test_results)
 
             return Response(data, status=status.HTTP_200_OK)
         except Exception as e:
-            error_code = str(uuid.uuid4())[:15]
-            error_log = main_models.ErrorLog.objects.create(
-                error_number=error_code,
-                error_message=str(e),
-                user_agent=request.META.get('HTTP_USER_AGENT'),
-                ip_address=request.META.get('REMOTE_ADDR'),
-            )
-            return Response({'error': 'Profile not found. Error ID: {}'.format(error_log.error_number)},
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'Profile not found. Error ID: {}'.format(error_code)},
                             status=status.HTTP_404_NOT_FOUND)
         
+class LeaderboardAPIView(APIView):
+    authentication_classes = [main_authentication.CachedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, test_id=None):
+        try:
+            test = main_cache.resolve_test(test_id)
+            if test is None:
+                return Response({'error': 'Test not found'}, status=status.HTTP_404_NOT_FOUND)
+            try:
+                limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+            except ValueError:
+                return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(main_leaderboard.build(test, request.profile.id, limit))
+        except Exception as e:
+            error_code = main_errorlog.log_error(request, e)
+            return Response({'error': 'An error occurred. Error ID: {}'.format(error_code)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def metrics_view(request):
+    return HttpResponse(main_metrics.export(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def results_export_view(request):
+    user = request.user
+    auth = request.headers.get('Authorization', '').split()
+    if len(auth) == 2 and auth[0].lower() == 'token':
+        entry = main_authentication.resolve(auth[1])
+        user = entry[1] if entry is not None else None
+    if user is None or not user.is_active or not user.is_staff:
+        return JsonResponse({'detail': 'Staff access required.'}, status=403)
+
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in main_resultexport.FORMATS:
+        return JsonResponse({'error': 'format must be csv or jsonl'}, status=400)
+    try:
+        queryset = main_resultexport.filter_results(test_id=request.GET.get('test'), date_from=request.GET.get('from'),
+                                                    date_to=request.GET.get('to'))
+    except main_resultexport.ExportError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return main_resultexport.response(queryset, fmt)
 
 # class PhotoAPIView(views.APIView):
 #     permission_classes = [AllowAny]
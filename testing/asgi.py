@@ -1,8 +1,8 @@
 import os
 from django.core.asgi import get_asgi_application
-
-django_asgi_app = get_asgi_application()
-
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testing.settings')
+django_application = get_asgi_application()
+
+from main.staticfiles import AsyncStaticFiles
 
-application = django_asgi_app
+application = AsyncStaticFiles(django_application)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -27,6 +28,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -36,6 +38,7 @@ MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'main.middleware.RequestTimeMiddleware',
+    'main.middleware.QueryCountMiddleware',
     'main.middleware.SecurityMiddleware',
     'main.middleware.GZipMiddleware',
     'main.middleware.RateLimitMiddleware',
@@ -61,15 +64,64 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'testing.wsgi.application'
 
+# Connections are kept for CONN_MAX_AGE seconds and checked before reuse. Every SQLite
+# connection gets SQLITE_PRAGMAS when it opens (see main.database); `manage.py bench_sqlite`
+# compares this profile with SQLite's defaults.
+CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 600))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     },
     'errors_db': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'errors_db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Optional read replicas of default, e.g. DB_REPLICAS=2 adds replica1 and replica2 on
+# db.replica1.sqlite3 and db.replica2.sqlite3. `manage.py refresh_replicas --loop` copies default
+# into them every DATABASE_REPLICA_REFRESH_INTERVAL seconds. Only request-time reads of
+# DATABASE_REPLICA_MODELS go to a replica, and they can lag that long.
+for number in range(1, int(os.environ.get('DB_REPLICAS', 0)) + 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db.replica{number}.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith('replica')]
+DATABASE_REPLICA_MODELS = [
+    'main.question',
+    'main.answer',
+    'main.test',
+    'main.test_questions',
+    'main.usertestresult',
+    'main.profilestats',
+]
+DATABASE_REPLICA_REFRESH_INTERVAL = 30
+
+# After a write, the same API token or session reads from the primary for this long. Pins are
+# kept in the DATABASE_PIN_CACHE cache so every worker sees them.
+DATABASE_PIN_SECONDS = 2 * DATABASE_REPLICA_REFRESH_INTERVAL
+DATABASE_PIN_CACHE = 'pins'
+
+# WAL lets readers run alongside the single writer; synchronous=NORMAL is durable across process
+# crashes in WAL mode (only an OS crash can lose the last commits). busy_timeout is in ms,
+# a negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'cache_size': -20000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
 }
 
 CSRF_TRUSTED_ORIGINS = ['https://*.serveo.net']
@@ -84,7 +136,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
      'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'main.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ),
@@ -158,6 +210,18 @@ SESSION_COOKIE_SAMESITE = 'Lax'
 #     }
 # }
 
+# 'pins' holds read-your-writes pins for the replica router and must be shared by all workers:
+# a file cache works for workers on one host, point it at memcached when there are several hosts.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'pins': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'testing-db-pins'),
+    },
+}
+
 SESSION_COOKIE_NAME = "session_cookie"
 SESSION_COOKIE_AGE = 1209600
 SESSION_SAVE_EVERY_REQUEST = True
@@ -184,3 +248,155 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Serialized question sets are cached per test and invalidated by model signals.
+# With the default per-process cache other workers only see changes after the timeout. The id
+# lists used to draw sampled questions are held in process memory on the same terms.
+QUESTION_CACHE_TIMEOUT = 300
+
+# Answer keys used for grading live in each process and reload when the question cache version
+# changes. With the default per-process cache other workers (and web workers after a
+# `manage.py import_questions` run) only pick up changes once their key is ANSWER_KEY_TTL seconds old.
+ANSWER_KEY_TTL = 300
+
+# Media files are expired by a background sweeper (see main.media) instead of per request.
+MEDIA_FILE_TTL = 10
+MEDIA_SWEEP_INTERVAL = 5
+MEDIA_RESCAN_INTERVAL = 60
+
+# Correct answers are applied with atomic UPDATEs. With SCORE_WRITE_BEHIND they are
+# buffered per profile and flushed every SCORE_FLUSH_INTERVAL_MS or SCORE_FLUSH_THRESHOLD increments.
+# The buffer lives in the worker process and /result/ only adds that worker's pending increments,
+# so only enable it with a single worker process (threads are fine).
+SCORE_WRITE_BEHIND = False
+SCORE_FLUSH_INTERVAL_MS = 200
+SCORE_FLUSH_THRESHOLD = 100
+
+# Quiz accounts sign in with their API token only, so registration stores an unusable password
+# and skips hashing. With REGISTRATION_SET_PASSWORD the phone number is hashed with the first
+# entry of PASSWORD_HASHERS; put a cheaper hasher first if signups must stay fast.
+REGISTRATION_SET_PASSWORD = False
+
+# Token -> (user, profile) lookups are cached for `ttl` seconds. The default per-process LRU is
+# invalidated by signals in the process that made the change; other workers see a deleted token or
+# deactivated user after at most `ttl`. Use 'store': 'memcache' for a shared, immediately invalidated cache.
+TOKEN_AUTH_CACHE = {
+    'ttl': 60,
+    'max_entries': 10000,
+    'store': 'local',
+}
+
+# Per-test leaderboards are kept in memory and updated as scores change. Each worker also
+# rebuilds its boards from the database every LEADERBOARD_REFRESH_INTERVAL seconds, in a background
+# thread; the previous board keeps serving until the new one is loaded.
+LEADERBOARD_REFRESH_INTERVAL = 60
+
+# Admin changelists below exact_below rows are counted exactly; larger unfiltered tables use the
+# database's row statistics (on SQLite, once ANALYZE has run) and everything else is counted up
+# to max_count. Error logs are always counted up to max_count.
+ADMIN_PAGINATOR = {
+    'exact_below': 10000,
+    'max_count': 100000,
+}
+
+# `manage.py prune_errors` deletes error logs older than `days` (and groups not seen since) in
+# batches of batch_size, sleeping `pause` seconds between batches. With `rotate`, rows are first
+# copied into monthly files in archive_dir, queryable as e.g. ErrorLog.objects.using('errors_2026_09').
+ERROR_RETENTION = {
+    'days': 30,
+    'batch_size': 1000,
+    'pause': 0.05,
+    'rotate': False,
+    'archive_dir': BASE_DIR / 'errors_archive',
+    'vacuum_pages': 2000,
+}
+
+# ErrorArchiveRouter only handles the monthly archive aliases; PrimaryReplicaRouter sends the
+# error tables to errors_db and everything else to default or a replica.
+DATABASE_ROUTERS = ['main.retention.ErrorArchiveRouter', 'main.database.PrimaryReplicaRouter']
+
+# Result notifications are written to the NotificationOutbox table by ResultAPIView and
+# delivered by a background worker (or `manage.py drain_outbox`). Without TELEGRAM_BOT_TOKEN
+# nothing is sent and entries stay pending.
+# global_rate and chat_rate are enforced per process: with N web workers each running the
+# autostarted worker, Telegram would see N times those rates. For more than one worker set
+# NOTIFICATION_WORKER_AUTOSTART=0 and run a single `manage.py drain_outbox --loop` instead.
+TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_CHAT_ID = os.environ.get('TELEGRAM_CHAT_ID', '-1002137089103')
+NOTIFICATION_TRANSPORT = 'main.notifications.TelegramTransport'
+NOTIFICATION_WORKER_AUTOSTART = os.environ.get('NOTIFICATION_WORKER_AUTOSTART', '1') == '1'
+NOTIFICATION_OUTBOX = {
+    'batch_size': 20,
+    'max_tries': 8,
+    'backoff': 2,
+    'global_rate': 30,
+    'chat_rate': 20,
+}
+
+# Errors are queued in process and written to errors_db by a background writer, which
+# upserts one ErrorGroup per fingerprint and keeps the latest `samples_per_group` ErrorLog rows.
+# When the queue is full entries are dropped, or with policy 'sample' every Nth one replaces the oldest.
+# Outcomes are exported at /metrics as error_log_entries_total{outcome=enqueued|written|dropped|failed}.
+ERROR_LOG_WRITER = {
+    'max_size': 10000,
+    'batch_size': 500,
+    'interval': 1.0,
+    'policy': 'drop',
+    'sample_rate': 10,
+    'samples_per_group': 20,
+}
+
+# Token buckets refill continuously: (capacity, seconds to refill from empty). A route's URL name
+# wins over path prefixes, of which the longest matching one wins. Use 'store': 'memcache' to
+# share buckets between workers.
+RATE_LIMIT = {
+    'store': os.environ.get('RATE_LIMIT_STORE', 'local'),
+    'location': os.environ.get('RATE_LIMIT_MEMCACHE', '127.0.0.1:11211'),
+    'max_entries': 10000,
+    'default': (100, 60),
+    # Keys are URL names (a tuple shares one bucket) or, starting with '/', path prefixes.
+    'routes': {
+        'register': (10, 60),
+        ('question', 'test-question'): (300, 60),
+    },
+}
+
+# Request latency histograms are written by each worker to METRICS_DIR and merged at /metrics.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'testing-metrics'))
+METRICS_FLUSH_INTERVAL = 5
+# Files of workers that have exited are deleted when /metrics is scraped. A file not rewritten
+# for METRICS_MAX_AGE seconds is left out too, which also hides a worker that served no request
+# in that time until its next write.
+METRICS_MAX_AGE = 600
+
+# Per-request SQL accounting. Sampled requests report query counts and time per database alias
+# into /metrics, log repeated identical queries and, with 'headers', add X-DB-* response headers.
+QUERY_ACCOUNTING = {
+    'sample_rate': 1.0 if DEBUG else 0.01,
+    'repeat_threshold': 2,
+    'headers': DEBUG,
+}
+
+# Responses below min_length are sent uncompressed. Responses with an ETag, or marked shared by the
+# view (compression.mark_shared), keep their compressed body in a per-process LRU so identical
+# payloads are only compressed once; per-user and shuffled bodies are compressed every time.
+GZIP = {
+    'level': 6,
+    'min_length': 200,
+    'cache_entries': 256,
+    'cache_max_body_size': 128 * 1024,
+}
+
+# Serve the quiz API from the native async views in main.async_views. Run it under an ASGI server,
+# e.g. `ASYNC_API=1 gunicorn testing.asgi:application -k uvicorn.workers.UvicornWorker`.
+ASYNC_API = os.environ.get('ASYNC_API') == '1'
+
+if ASYNC_API:
+    # WhiteNoiseMiddleware is sync-only and would run every request through a thread; under ASGI,
+    # testing/asgi.py serves static files in front of Django instead.
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+    # ORM calls from async views run in sync_to_async threads, which do not outlive the request,
+    # so persistent connections would never be reused and SQLite handles would pile up.
+    CONN_MAX_AGE = 0
+    for database in DATABASES.values():
+        database['CONN_MAX_AGE'] = 0
@@ -4,10 +4,13 @@ from django.conf import settings
 from django.urls import re_path
 from django.views.static import serve
 from main.urls import urlpatterns as main_urls
+from main.async_urls import urlpatterns as main_async_urls
+from main.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/v1/' , include(main_urls))
+    path('api/v1/' , include(main_async_urls if settings.ASYNC_API else main_urls)),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 if settings.DEBUG: